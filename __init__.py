@@ -34,6 +34,7 @@ Shows channel messages when tracked users are registered for a race.
 Allows users to join or spectate other users in race.
 """
 
+import sys
 import supybot
 import supybot.world as world
 
@@ -51,15 +52,35 @@ __contributors__ = {}
 # This is a url where the most recent plugin package can be downloaded.
 __url__ = 'https://github.com/jasonn85/Racebot' # 'http://supybot.com/Members/yourname/Racebot/download'
 
+def _isLoaded(moduleName):
+    return '%s.%s' % (__name__, moduleName) in sys.modules
+
+# Only reload modules that were already imported; reloading on first load would execute them twice.
+_pluginWasLoaded = _isLoaded('plugin')
+
 import config
 import plugin
-reload(plugin) # In case we're being reloaded.
+if _pluginWasLoaded:
+    reload(plugin) # In case we're being reloaded.
+# replay, diagnostics and statusserver are only imported when used, but must be reloaded along with plugin if they have been.
+if _isLoaded('replay'):
+    import replay
+    reload(replay)
+if _isLoaded('diagnostics'):
+    import diagnostics
+    reload(diagnostics)
+if _isLoaded('statusserver'):
+    import statusserver
+    reload(statusserver)
 # Add more reloads here if you add third-party modules and want them to be
 # reloaded when this plugin is reloaded.  Don't forget to import them as well!
 
 if world.testing:
+    _testWasLoaded = _isLoaded('test')
+
     import test
-    reload(test)
+    if _testWasLoaded:
+        reload(test)
 
 Class = plugin.Class
 configure = config.configure
@@ -0,0 +1,140 @@
+###
+# Copyright (c) 2015, Jason Neel
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+###
+
+"""
+Rough timings for the parts of Racebot that run on the IRC thread.
+
+Run it from the directory that contains the Racebot plugin directory (the same place supybot-test is run from):
+
+    python Racebot/bench.py
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PLUGIN_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+MAIN_PAGE_FILENAME = os.path.join(PLUGIN_DIRECTORY, 'data', 'iRacingMainPage.txt')
+
+# Modules whose import cost we care about.  Each is imported in a fresh interpreter so nothing is already cached.
+IMPORTS_TO_MEASURE = ['supybot.callbacks', 'requests', 'sqlite3', 'json', 're', 'Racebot.plugin']
+
+
+def report(label, seconds, repetitions=1):
+    if repetitions == 1:
+        print('%-45s %10.2f ms' % (label, seconds * 1000))
+    else:
+        print('%-45s %10.2f ms  (%.3f ms each, %d runs)' % (label, seconds * 1000, seconds * 1000 / repetitions, repetitions))
+
+
+def timed(label, function, repetitions=1):
+    startTime = time.time()
+
+    for _ in range(repetitions):
+        result = function()
+
+    report(label, time.time() - startTime, repetitions)
+    return result
+
+
+IMPORT_TIME_MARKER = 'RACEBOT_BENCH_IMPORT_SECONDS '
+
+
+def measureImport(moduleName):
+    """Import time of moduleName in a fresh interpreter, or None if it cannot be imported.  The timing is marked
+    because some imports print their own output (supybot logs "Shutdown complete." to stdout at exit.)"""
+    script = 'import time; t = time.time(); import %s; print(%r + repr(time.time() - t))' % (moduleName,
+                                                                                            IMPORT_TIME_MARKER)
+    process = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               cwd=os.path.dirname(PLUGIN_DIRECTORY))
+    output, _ = process.communicate()
+
+    if process.returncode != 0:
+        return None
+
+    for line in output.splitlines():
+        if line.startswith(IMPORT_TIME_MARKER):
+            return float(line[len(IMPORT_TIME_MARKER):])
+
+    return None
+
+
+class StockConnection(object):
+    """Serves the stock iRacing main page that ships with the tests instead of talking to iRacing"""
+
+    def __init__(self):
+        with open(MAIN_PAGE_FILENAME, 'r') as mainPage:
+            self.mainPage = mainPage.read()
+
+    def login(self):
+        return None
+
+    def fetchMainPageRawHTML(self):
+        return self.mainPage
+
+    def fetchDriverStatusJSON(self, friends=True, studied=True, onlineOnly=False):
+        return None
+
+
+def benchmarkImports():
+    print('Import times (fresh interpreter each):')
+
+    for moduleName in IMPORTS_TO_MEASURE:
+        seconds = measureImport(moduleName)
+
+        if seconds is None:
+            print('%-45s %13s' % ('  import ' + moduleName, 'unavailable'))
+        else:
+            report('  import ' + moduleName, seconds)
+
+
+def benchmarkWarmUp():
+    sys.path.insert(0, os.path.dirname(PLUGIN_DIRECTORY))
+    from Racebot.plugin import IRacingData, RacebotDB
+
+    print('Warm-up phase:')
+
+    databaseFilename = os.path.join(tempfile.mkdtemp(), 'racebot_bench.sqlite3')
+    db = timed('  create database', lambda: RacebotDB(databaseFilename))
+    timed('  open existing database', lambda: RacebotDB(databaseFilename))
+
+    racingData = IRacingData(StockConnection(), db)
+    timed('  load catalog from main page', racingData.grabSeasonData)
+    timed('  reload catalog (waits for a fresh worker)', racingData.grabSeasonData)
+    racingData.closeCatalogWorkerPool()
+
+
+if __name__ == '__main__':
+    benchmarkImports()
+    benchmarkWarmUp()
+
+# vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
@@ -63,6 +63,23 @@ conf.registerChannelValue(Racebot, 'raceRegistrationAlerts',
 conf.registerChannelValue(Racebot, 'nonRaceRegistrationAlerts',
                           registry.Boolean(False, """Determines whether the bot will broadcast in this channel whenever
                           a user joins a session other than a race (practice, qual, etc.)"""))
+conf.registerGlobalValue(Racebot, 'captureFilename',
+                         registry.String('', """If set, every driver status and main page response from iRacing is
+                         appended to this gzipped log so that it can be replayed later.  Empty disables capturing."""))
+conf.registerGlobalValue(Racebot, 'memoryGrowthWarningBytes',
+                         registry.NonNegativeInteger(10 * 1024 * 1024, """While memory monitoring is on (see the
+                         memory command), warn in the log when memory grows by more than this many bytes."""))
+conf.registerGlobalValue(Racebot, 'skipIdleDrivers',
+                         registry.Boolean(False, """Compares each poll with the last so that only the drivers who
+                         are new, or in a session now or on the last poll, are updated.  Everyone else's last seen
+                         time and other details are left as they were.  Worth it when watching many thousands of
+                         drivers.  Takes effect when the plugin is (re)loaded.  (This was columnarDriverState.)"""))
+conf.registerGlobalValue(Racebot, 'statusServerPort',
+                         registry.NonNegativeInteger(0, """Port for a read-only HTTP server that serves online drivers
+                         and the catalogs as JSON.  0 disables it.  Takes effect when the plugin is (re)loaded."""))
+conf.registerGlobalValue(Racebot, 'statusServerHost',
+                         registry.String('127.0.0.1', """Address the status server listens on.  Only change this
+                         from localhost if the port is otherwise protected."""))
 
 
 
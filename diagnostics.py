@@ -0,0 +1,215 @@
+###
+# Copyright (c) 2015, Jason Neel
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+###
+
+"""
+Memory accounting for long running bots: how many objects, and roughly how many bytes, each of Racebot's structures
+holds, and warnings when that grows too much between ticks.  Sizes are sys.getsizeof summed over everything a structure
+reaches that has not already been counted, so they are approximate but comparable from one tick to the next.
+"""
+
+import gc
+import sys
+
+import supybot.log as logger
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2 has no tracemalloc; growth is then judged from the structure sizes alone
+    tracemalloc = None
+
+
+def approximateSize(obj, seen):
+    """Bytes used by obj and everything it reaches through containers and instance attributes, skipping anything
+    whose id() is in seen (which is updated as we go)"""
+    size = 0
+    pending = [obj]
+
+    while pending:
+        current = pending.pop()
+
+        if id(current) in seen:
+            continue
+
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+
+        if isinstance(current, dict):
+            pending.extend(current.keys())
+            pending.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            pending.extend(current)
+        elif hasattr(current, '__dict__') and not isinstance(current, type):
+            pending.append(current.__dict__)
+
+    return size
+
+
+def formatBytes(byteCount):
+    for unit in ('bytes', 'KB', 'MB'):
+        if abs(byteCount) < 1024:
+            return '%.0f %s' % (byteCount, unit) if unit == 'bytes' else '%.1f %s' % (byteCount, unit)
+
+        byteCount /= 1024.0
+
+    return '%.1f GB' % byteCount
+
+
+class StructureSize(object):
+
+    def __init__(self, name, count, byteCount):
+        self.name = name
+        self.count = count
+        self.byteCount = byteCount
+
+    def __str__(self):
+        return '%s: %i, ~%s' % (self.name, self.count, formatBytes(self.byteCount))
+
+
+def structureSizes(racebot):
+    """A StructureSize for each of racebot's long lived structures.  Each object is counted once, under the first
+    structure that reaches it."""
+    racingData = racebot.iRacingData
+
+    # Never count the objects everything points back at
+    seen = set(id(shared) for shared in (racebot, racingData, racingData.db, racingData.iRacingConnection))
+
+    sessions = []
+    for driver in racingData.driversByID.values():
+        session = driver.currentSession
+
+        if session is not None:
+            sessions.append(session)
+
+            if session.oldestDataThisSession is not session:
+                sessions.append(session.oldestDataThisSession)
+
+    def measure(name, count, *structures):
+        return StructureSize(name, count, sum(approximateSize(structure, seen) for structure in structures))
+
+    # The calendar and search indexes are built when first used; measuring them must not be what builds them
+    calendar, searchIndexes = racingData.catalog.builtStructures()
+    calendars = [] if calendar is None else [calendar]
+
+    # Sessions first, so that drivers are not charged for them
+    sizes = [
+        measure('sessions', len(sessions), sessions),
+        measure('drivers', len(racingData.driversByID), racingData.driversByID),
+        measure('tracks', len(racingData.tracksByID), racingData.tracksByID),
+        measure('cars', len(racingData.carsByID), racingData.carsByID),
+        measure('car classes', len(racingData.carClassesByID), racingData.carClassesByID),
+        measure('seasons', len(racingData.seasonsByID), racingData.seasonsByID),
+        measure('calendar race weeks', sum(len(aCalendar) for aCalendar in calendars), *calendars),
+        measure('search index entries', sum(len(index) for index in searchIndexes), *searchIndexes),
+        measure('render cache entries', len(racingData.driverNameCache) + len(racingData.sessionDescriptionCache),
+                racingData.driverNameCache, racingData.sessionDescriptionCache),
+        measure('subscriptions', len(racebot.subscriptionIndex), racebot.subscriptionIndex),
+        measure('subscription notifications', len(racingData.subscriptionNotifications),
+                racingData.subscriptionNotifications),
+        measure('channel announcements', len(racingData.channelAnnouncements), racingData.channelAnnouncements),
+    ]
+
+    if racingData.driverStateStore is not None:
+        sizes.append(measure('driver states', len(racingData.driverStateStore), racingData.driverStateStore))
+
+    return sizes
+
+
+class MemoryMonitor(object):
+    """Measures Racebot's structures (and, where tracemalloc exists, everything allocated) after each tick, and warns
+    when they have grown by more than thresholdBytes since the first tick it watched."""
+
+    TOP_ALLOCATION_SITES = 5
+
+    def __init__(self, thresholdBytes):
+        self.thresholdBytes = thresholdBytes
+        self.baselineSizes = None
+        self.baselineSnapshot = None
+        self.tickCount = 0
+
+    @property
+    def isTracing(self):
+        return tracemalloc is not None and tracemalloc.is_tracing()
+
+    def start(self):
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        if self.isTracing:
+            tracemalloc.stop()
+
+    def afterTick(self, racebot):
+        sizes = structureSizes(racebot)
+        snapshot = tracemalloc.take_snapshot() if self.isTracing else None
+        self.tickCount += 1
+
+        if self.baselineSizes is None:
+            self.baselineSizes = sizes
+            self.baselineSnapshot = snapshot
+            return
+
+        growth = sum(size.byteCount for size in sizes) - sum(size.byteCount for size in self.baselineSizes)
+
+        if snapshot is not None and self.baselineSnapshot is not None:
+            differences = snapshot.compare_to(self.baselineSnapshot, 'lineno')
+            growth = max(growth, sum(difference.size_diff for difference in differences))
+        else:
+            differences = []
+
+        if growth < self.thresholdBytes:
+            return
+
+        grownStructures = ['%s +%s' % (size.name, formatBytes(size.byteCount - baseline.byteCount))
+                           for size, baseline in zip(sizes, self.baselineSizes) if size.byteCount > baseline.byteCount]
+        logger.warning('Racebot memory has grown by %s over %i ticks: %s', formatBytes(growth), self.tickCount - 1,
+                       ', '.join(grownStructures) or 'none of its own structures')
+
+        for difference in differences[:self.TOP_ALLOCATION_SITES]:
+            logger.warning('  %s', difference)
+
+        # Warn about further growth from here rather than repeating this warning every tick
+        self.baselineSizes = sizes
+        self.baselineSnapshot = snapshot
+        self.tickCount = 1
+
+
+def summarize(racebot):
+    """One line describing the size of each of racebot's structures"""
+    parts = [str(size) for size in structureSizes(racebot)]
+    parts.append('gc objects: %i' % len(gc.get_objects()))
+
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        parts.append('traced: %s (peak %s)' % (formatBytes(current), formatBytes(peak)))
+
+    return '; '.join(parts)
+
+# vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
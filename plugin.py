@@ -31,24 +31,83 @@
 import supybot.utils as utils
 import os
 from supybot.commands import *
-import requests
 import sys
-import re
-import json
 import supybot.log as logger
 import supybot.plugins as plugins
 import supybot.ircutils as ircutils
 import supybot.callbacks as callbacks
+import supybot.ircdb as ircdb
+import supybot.world as world
 import logging
 import supybot.schedule as schedule
 import supybot.ircmsgs as ircmsgs
+import bisect
+import csv
 import datetime
-import time
+import gzip
+import itertools
+import json
+import multiprocessing
+import random
+import re
 import sqlite3
+import threading
+import time
+import urllib
+
+def importRequests():
+    """requests is slow to import (see bench.py) and not needed until we talk to iRacing, so it is imported here, on
+    first use, rather than with the plugin on the thread that talks to IRC"""
+    import requests
+    return requests
 
 class NoCredentialsException(Exception):
     pass
 
+def decodeListingName(name):
+    """Names in the iRacing main page listings are URL encoded (Circuit+de+Spa-Francorchamps, N%C3%BCrburgring...)"""
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+
+    return urllib.unquote_plus(name).decode('utf-8')
+
+def decodeIrcArgument(text):
+    """Command arguments arrive from IRC as UTF-8 byte strings; sqlite3 and our unicode names want unicode"""
+    if isinstance(text, unicode):
+        return text
+
+    return text.decode('utf-8', 'replace')
+
+class RenderCache(object):
+    """Memoizes strings that are rendered over and over when building replies (driver names, session descriptions.)
+    Every lookup carries the version of the data the string was built from; when that version changes, everything
+    cached is thrown away."""
+
+    def __init__(self):
+        self._renderedByKey = {}
+        self._version = None
+
+    def __len__(self):
+        return len(self._renderedByKey)
+
+    def get(self, key, version, render):
+        """Returns the cached string for key, calling render() to build it if we do not have one for this version"""
+        if version != self._version:
+            self._renderedByKey.clear()
+            self._version = version
+
+        rendered = self._renderedByKey.get(key)
+
+        if rendered is None:
+            rendered = render()
+            self._renderedByKey[key] = rendered
+
+        return rendered
+
+    def clear(self):
+        self._renderedByKey.clear()
+        self._version = None
+
 class Session(object):
 
     # If we see someone registered for a practice without joining for this long, we can assume the server is holding
@@ -178,6 +237,13 @@ class Session(object):
 
     @property
     def sessionDescription(self):
+        # Everything the description depends on, other than the catalog data that is versioned separately
+        key = (self.subSessionId, self.eventTypeId, self.seasonId, self.isPotentiallyPreRaceSession,
+               self.isHostedSession, self.isPrivateSession)
+        return self.racingData.sessionDescriptionCache.get(key, self.racingData.catalogVersion,
+                                                           self._renderSessionDescription)
+
+    def _renderSessionDescription(self):
         isRace = False
 
         sessionType = 'Unknown Session Type'
@@ -301,6 +367,9 @@ class Driver(object):
         return 'sessionId' in json
 
     def nameForPrinting(self):
+        return self.racingData.driverNameCache.get(self.id, self.db.preferencesVersion, self._renderNameForPrinting)
+
+    def _renderNameForPrinting(self):
         nick = self.nickname
 
         if nick is not None:
@@ -308,16 +377,402 @@ class Driver(object):
 
         return self.name.replace('+', ' ')
 
+class RaceWeek(object):
+    """One week of a season's schedule: a series racing at one track"""
+
+    def __init__(self, season, track, startTime, endTime):
+        self.seriesId = season['seriesid']
+        self.seriesName = decodeListingName(season['seriesshortname'])
+        self.trackId = track['id']
+        self.trackName = decodeListingName(track['name'])
+        self.trackConfig = decodeListingName(track.get('config') or '')
+        self.raceWeek = track['raceweek'] + 1       # Zero based in the listing, one based everywhere else
+        self.startTime = startTime
+        self.endTime = endTime
+
+    @property
+    def trackDescription(self):
+        if self.trackConfig:
+            return '%s - %s' % (self.trackName, self.trackConfig)
+
+        return self.trackName
+
+class RaceCalendar(object):
+    """Sorted timeline of every race week in the season listing, built once per catalog load so that questions like
+    "what starts next" or "when does this series change tracks" are a bisect rather than a walk over every season.
+
+    The main page only tells us when seasons start and which track each week visits, not individual session times,
+    so the finest grain here is the race week."""
+
+    SECONDS_PER_RACE_WEEK = 7 * 24 * 60 * 60
+
+    def __init__(self, seasons):
+        raceWeeks = []
+
+        for season in seasons:
+            seasonStartTime = season['start'] / 1000.0
+            seasonEndTime = season['end'] / 1000.0
+
+            for track in season.get('tracks', []):
+                startTime = seasonStartTime + track['raceweek'] * self.SECONDS_PER_RACE_WEEK
+
+                if startTime >= seasonEndTime:
+                    continue
+
+                endTime = min(startTime + self.SECONDS_PER_RACE_WEEK, seasonEndTime)
+                raceWeeks.append(RaceWeek(season, track, startTime, endTime))
+
+        raceWeeks.sort(key=lambda raceWeek: raceWeek.startTime)
+
+        self._raceWeeks = raceWeeks
+        self.startTimes = [raceWeek.startTime for raceWeek in raceWeeks]
+
+        # Each series' and track's own sorted timeline, in parallel with a list of its start times to bisect
+        self._raceWeeksBySeriesID = {}
+        self._raceWeeksByTrackID = {}
+
+        for raceWeek in raceWeeks:
+            self._raceWeeksBySeriesID.setdefault(raceWeek.seriesId, []).append(raceWeek)
+            self._raceWeeksByTrackID.setdefault(raceWeek.trackId, []).append(raceWeek)
+
+        self.startTimesBySeriesID = dict((seriesId, [raceWeek.startTime for raceWeek in seriesRaceWeeks])
+                                          for seriesId, seriesRaceWeeks in self._raceWeeksBySeriesID.items())
+        self.startTimesByTrackID = dict((trackId, [raceWeek.startTime for raceWeek in trackRaceWeeks])
+                                         for trackId, trackRaceWeeks in self._raceWeeksByTrackID.items())
+
+        # Sorted (lowercase name, series ID) pairs so that a name prefix is also a bisect
+        seriesNames = set((decodeListingName(season['seriesshortname']).lower(), season['seriesid']) for season in seasons)
+        self._seriesNames = sorted(seriesNames)
+
+    def __len__(self):
+        return len(self._raceWeeks)
+
+    def nextStartTime(self, after):
+        """The first time after the given time that any race week starts, or None if none are scheduled"""
+        index = bisect.bisect_right(self.startTimes, after)
+        return self.startTimes[index] if index < len(self.startTimes) else None
+
+    def raceWeeksStartingBetween(self, startTime, endTime):
+        """All race weeks starting after startTime, up to and including endTime, soonest first"""
+        first = bisect.bisect_right(self.startTimes, startTime)
+        last = bisect.bisect_right(self.startTimes, endTime)
+        return self._raceWeeks[first:last]
+
+    def nextRaceWeekForSeries(self, seriesId, after):
+        return self._nextRaceWeek(self._raceWeeksBySeriesID, self.startTimesBySeriesID, seriesId, after)
+
+    def nextRaceWeekForTrack(self, trackId, after):
+        return self._nextRaceWeek(self._raceWeeksByTrackID, self.startTimesByTrackID, trackId, after)
+
+    @staticmethod
+    def _nextRaceWeek(raceWeeksByKey, startTimesByKey, key, after):
+        startTimes = startTimesByKey.get(key)
+
+        if startTimes is None:
+            return None
+
+        index = bisect.bisect_right(startTimes, after)
+        return raceWeeksByKey[key][index] if index < len(startTimes) else None
+
+    def seriesIDsWithNamePrefix(self, prefix):
+        """IDs of every series whose short name starts with prefix (case insensitive)"""
+        prefix = prefix.lower()
+        index = bisect.bisect_left(self._seriesNames, (prefix,))
+        seriesIDs = []
+
+        while index < len(self._seriesNames) and self._seriesNames[index][0].startswith(prefix):
+            seriesIDs.append(self._seriesNames[index][1])
+            index += 1
+
+        return seriesIDs
+
+class CatalogSearchIndex(object):
+    """Name lookup for a catalog (tracks, cars or series), built once per catalog load.
+
+    Every word of every name is indexed by all of its prefixes, so a query whose words all start words of a name
+    ("skip barber", "spa", "mx5") is a handful of set intersections.  Queries that do not match that way fall back to
+    trigrams of the name with everything but letters and digits removed, ranked by how many of the query's trigrams
+    each name shares, which forgives typos and odd spacing."""
+
+    # Fraction of the query's trigrams a name must share to be a fuzzy match
+    FUZZY_MATCH_THRESHOLD = 0.5
+
+    def __init__(self, entries):
+        """
+        @param entries: (id, name to show, text to search) tuples
+        """
+        self.namesByID = {}
+        self._idsByTokenPrefix = {}
+        self._idsByTrigram = {}
+
+        for entryID, name, searchText in entries:
+            self.namesByID[entryID] = name
+
+            for token in self._tokens(searchText):
+                for length in range(1, len(token) + 1):
+                    self._idsByTokenPrefix.setdefault(token[:length], set()).add(entryID)
+
+            for trigram in self._trigrams(searchText):
+                self._idsByTrigram.setdefault(trigram, set()).add(entryID)
+
+    def __len__(self):
+        return len(self.namesByID)
+
+    @staticmethod
+    def _words(text):
+        return [re.findall(r'[^\W_]+', word, re.UNICODE) for word in text.lower().split()]
+
+    @classmethod
+    def _tokens(cls, text):
+        """Every alphanumeric run in text, plus each word with its punctuation squeezed out (MX-5 is mx, 5 and mx5)"""
+        tokens = set()
+
+        for pieces in cls._words(text):
+            tokens.update(pieces)
+
+            if len(pieces) > 1:
+                tokens.add(''.join(pieces))
+
+        return tokens
+
+    @classmethod
+    def _trigrams(cls, text):
+        squeezed = ''.join(''.join(pieces) for pieces in cls._words(text))
+
+        if len(squeezed) < 3:
+            return set([squeezed]) if squeezed else set()
+
+        return set(squeezed[index:index + 3] for index in range(len(squeezed) - 2))
+
+    def _sortKey(self, entryID):
+        name = self.namesByID[entryID]
+        return len(name), name
+
+    def search(self, query):
+        """IDs of the entries matching query, best first"""
+        matches = None
+
+        for token in self._tokens(query):
+            matchingIDs = self._idsByTokenPrefix.get(token, set())
+            matches = set(matchingIDs) if matches is None else matches & matchingIDs
+
+            if len(matches) == 0:
+                break
+
+        if matches:
+            # Shortest first: the least extra text beyond what was asked for
+            return sorted(matches, key=self._sortKey)
+
+        queryTrigrams = self._trigrams(query)
+        sharedTrigramCounts = {}
+
+        for trigram in queryTrigrams:
+            for entryID in self._idsByTrigram.get(trigram, ()):
+                sharedTrigramCounts[entryID] = sharedTrigramCounts.get(entryID, 0) + 1
+
+        minimumSharedTrigrams = self.FUZZY_MATCH_THRESHOLD * len(queryTrigrams)
+        fuzzyMatches = [entryID for entryID, sharedTrigramCount in sharedTrigramCounts.items()
+                        if sharedTrigramCount >= minimumSharedTrigrams]
+
+        return sorted(fuzzyMatches, key=lambda entryID: (-sharedTrigramCounts[entryID], self._sortKey(entryID)))
+
+class RegistrationAlert(object):
+    """A driver registered for a session, to be announced wherever that kind of session is announced"""
+
+    def __init__(self, driver, session):
+        """
+        @type driver: Driver
+        @type session: Session
+        """
+        self.driver = driver
+        self.session = session
+        self.isRace = session.isRaceOrPreRacePractice
+        self.message = '%s is registered for a %s' % (driver.nameForPrinting(), session.sessionDescription.lower())
+
+class SubscriptionIndex(object):
+    """Inverted indexes over the subscriptions table, kept in memory: for each driver, series and track, the
+    (network, nick)s who want a private message when it shows up in a registration.  Matching an alert costs three
+    dictionary lookups plus the subscribers found, however many subscriptions there are in total."""
+
+    KINDS = ('driver', 'series', 'track')
+
+    def __init__(self, subscriptions=()):
+        """
+        @param subscriptions: (network, nick, kind, target ID) tuples, as from RacebotDB.subscriptions()
+        """
+        self._subscribersByTargetByKind = dict((kind, {}) for kind in self.KINDS)
+
+        for network, nick, kind, targetID in subscriptions:
+            self.add(network, nick, kind, targetID)
+
+    def __len__(self):
+        return sum(len(subscribers) for subscribersByTarget in self._subscribersByTargetByKind.values()
+                   for subscribers in subscribersByTarget.values())
+
+    def add(self, network, nick, kind, targetID):
+        self._subscribersByTargetByKind[kind].setdefault(targetID, set()).add((network, nick))
+
+    def remove(self, network, nick, kind, targetID):
+        subscribersByTarget = self._subscribersByTargetByKind[kind]
+        subscribers = subscribersByTarget.get(targetID)
+
+        if subscribers is not None:
+            subscribers.discard((network, nick))
+
+            if len(subscribers) == 0:
+                del subscribersByTarget[targetID]
+
+    def subscribersForAlert(self, alert):
+        """
+        @type alert: RegistrationAlert
+        @return: set of (network, nick)
+        """
+        subscribers = set()
+
+        for kind, targetID in (('driver', alert.driver.id), ('series', alert.session.seasonId),
+                               ('track', alert.session.trackId)):
+            found = self._subscribersByTargetByKind[kind].get(targetID)
+
+            if found:
+                subscribers |= found
+
+        return subscribers
+
+class DriverStateStore(object):
+    """Which drivers were in a session on the last poll, so that each poll only updates the drivers whose state could
+    have changed: those in a session now or on the last poll, and those seen for the first time.  Everyone else has no
+    session before or after, and updating them changes nothing.
+
+    A poll is read a field at a time (custid, and whether there is a session) with map, compress and set operations,
+    which run in C.  Only the drivers that need updating reach Python code.
+
+    The price is that an idle driver's Driver.json is no longer refreshed every poll, so its lastSeen and the like are
+    whatever they were when the driver was last updated.  Nothing that decides sessions or alerts reads them."""
+
+    def __init__(self):
+        self._driverIDs = set()
+        self._driverIDsInSessions = set()
+
+    def __len__(self):
+        return len(self._driverIDs)
+
+    def load(self, racersJSON):
+        """Records a poll, and returns the racers from it that need updating
+
+        @param racersJSON: The fsRacers of a driver status poll
+        """
+        racerCount = len(racersJSON)
+        driverIDs = map(dict.__getitem__, racersJSON, itertools.repeat('custid', racerCount))
+
+        # 'sessionId' in racerJSON, as Driver decides whether a driver is in a session
+        inSessions = map(dict.__contains__, racersJSON, itertools.repeat('sessionId', racerCount))
+        driverIDsInSessions = set(itertools.compress(driverIDs, inSessions))
+
+        polledDriverIDs = set(driverIDs)
+        newDriverIDs = polledDriverIDs - self._driverIDs
+        self._driverIDs.update(newDriverIDs)
+
+        driverIDsToUpdate = newDriverIDs | driverIDsInSessions | (self._driverIDsInSessions & polledDriverIDs)
+
+        # Drivers left out of this poll keep the session they had, as their Driver does
+        self._driverIDsInSessions = driverIDsInSessions | (self._driverIDsInSessions - polledDriverIDs)
+
+        return list(itertools.compress(racersJSON, map(driverIDsToUpdate.__contains__, driverIDs)))
+
+class Catalog(object):
+    """The track, car, car class and season listings from the iRacing main page.  Built by parseCatalog in a worker
+    process and sent back as no more than the listings and the race week start times, which is quick to unpickle (see
+    IRacingData.grabSeasonData.)  The calendar and search indexes are built from them the first time they are used."""
+
+    def __init__(self, tracks, cars, carClasses, seasons):
+        self.tracksByID = dict((track['id'], track) for track in tracks)
+        self.carsByID = dict((car['id'], car) for car in cars)
+        self.carClassesByID = dict((carClass['id'], carClass) for carClass in carClasses)
+        self.seasonsByID = dict((season['seriesid'], season) for season in seasons)
+
+        # Enough of the calendar for every tick to tell whether a race week has started (and so the catalog changed)
+        self.raceWeekStartTimes = sorted(set(RaceCalendar(self.seasonsByID.values()).startTimes))
+
+        self._calendar = None
+        self._searchIndexes = None
+
+    @property
+    def calendar(self):
+        if self._calendar is None:
+            self._calendar = RaceCalendar(self.seasonsByID.values())
+
+        return self._calendar
+
+    @property
+    def trackIndex(self):
+        return self._buildSearchIndexes()[0]
+
+    @property
+    def carIndex(self):
+        return self._buildSearchIndexes()[1]
+
+    @property
+    def seriesIndex(self):
+        return self._buildSearchIndexes()[2]
+
+    def builtStructures(self):
+        """(calendar, search indexes) as far as they have been built: the calendar or None, and the three indexes or
+        none of them.  For measuring them without building them (see diagnostics.py.)"""
+        return self._calendar, self._searchIndexes or ()
+
+    def _buildSearchIndexes(self):
+        if self._searchIndexes is not None:
+            return self._searchIndexes
+
+        trackEntries = []
+        for track in self.tracksByID.values():
+            name = decodeListingName(track['name'])
+            config = decodeListingName(track.get('config') or '')
+
+            if config:
+                name = '%s - %s' % (name, config)
+
+            trackEntries.append((track['id'], name, name))
+
+        carEntries = []
+        for car in self.carsByID.values():
+            name = decodeListingName(car['name'])
+            carEntries.append((car['id'], name, '%s %s' % (name, car.get('abbrevname') or '')))
+
+        seriesEntries = []
+        for season in self.seasonsByID.values():
+            name = decodeListingName(season['seriesshortname'])
+            seriesEntries.append((season['seriesid'], name, '%s %s' % (name, decodeListingName(season.get('seriesname') or ''))))
+
+        self._searchIndexes = (CatalogSearchIndex(trackEntries), CatalogSearchIndex(carEntries),
+                               CatalogSearchIndex(seriesEntries))
+        return self._searchIndexes
+
+def parseCatalog(rawMainPageHTML):
+    """Extracts and decodes the listings in the iRacing main page Javascript.  Returns a Catalog, or None if the
+    listings could not be found.  This runs in a worker process, so it must not touch anything but its argument (not
+    even the log, whose locks may have been held by another thread when the worker was forked.)
+
+    @type rawMainPageHTML: str
+    @rtype: Catalog
+    """
+
+    try:
+        trackJSON = re.search("var TrackListing\\s*=\\s*extractJSON\\('(.*)'\\);", rawMainPageHTML).group(1)
+        carJSON = re.search("var CarListing\\s*=\\s*extractJSON\\('(.*)'\\);", rawMainPageHTML).group(1)
+        carClassJSON = re.search("var CarClassListing\\s*=\\s*extractJSON\\('(.*)'\\);", rawMainPageHTML).group(1)
+        seasonJSON = re.search("var SeasonListing\\s*=\\s*extractJSON\\('(.*)'\\);", rawMainPageHTML).group(1)
+
+        return Catalog(json.loads(trackJSON), json.loads(carJSON), json.loads(carClassJSON), json.loads(seasonJSON))
+
+    except (AttributeError, ValueError):
+        return None
+
 class IRacingData:
     """Aggregates all driver and session data into dictionaries."""
 
-    driversByID = {}
-    tracksByID = {}
-    carsByID = {}
-    carClassesByID = {}
-    seasonsByID = {}
-
     SECONDS_BETWEEN_CACHING_SEASON_DATA = 43200     # 12 hours
+    SECONDS_TO_WAIT_FOR_CATALOG = 120
 
     def __init__(self, iRacingConnection, db):
         """
@@ -327,66 +782,189 @@ class IRacingData:
         self.iRacingConnection = iRacingConnection
         self.db = db
         self.lastSeasonDataFetchTime = None
+        self.lastDriverDataTime = None
+
+        # If set, grabData hands catalog refreshes to the worker and carries on with the old catalog until the new one
+        #  is ready, rather than waiting for it
+        self.refreshCatalogInBackground = False
+
+        # A DriverStateStore, if set, lets grabData skip the drivers whose state has not changed.  With tens of
+        #  thousands of drivers, nearly all of them idle, that is most of them.
+        self.driverStateStore = None
+
+        # (network, nick, driver ID, subsession ID)s messaged on the last tick, so subscribers hear about each
+        #  registration once rather than every tick
+        self.subscriptionNotifications = set()
+
+        # (network, channel, driver ID, subsession ID)s announced on the last tick, likewise for channels
+        self.channelAnnouncements = set()
+
+        # Per instance, so that a replay (see replay.py) never shares state with the live data
+        self.driversByID = {}
+        self.tracksByID = {}
+        self.carsByID = {}
+        self.carClassesByID = {}
+        self.seasonsByID = {}
+        self.catalog = Catalog([], [], [], [])
+        self._catalogWorkerPool = None
+
+        # (AsyncResult, fetch time) of a catalog the worker is parsing in the background, if any
+        self._pendingCatalog = None
+
+        # Bumped whenever track/car/season data is reloaded, invalidating anything rendered from it
+        self.catalogVersion = 0
+        self.driverNameCache = RenderCache()
+        self.sessionDescriptionCache = RenderCache()
+
+    @property
+    def calendar(self):
+        return self.catalog.calendar
+
+    @property
+    def trackIndex(self):
+        return self.catalog.trackIndex
+
+    @property
+    def carIndex(self):
+        return self.catalog.carIndex
+
+    @property
+    def seriesIndex(self):
+        return self.catalog.seriesIndex
+
+    def catalogWorkerPool(self):
+        """The process that parses the catalog.  Decoding the listings is CPU bound and would hold the GIL (and so
+        IRC) for as long as it takes if done on one of our threads."""
+        if self._catalogWorkerPool is None:
+            # Parsing leaves a large heap behind, so each refresh gets a fresh worker
+            self._catalogWorkerPool = multiprocessing.Pool(processes=1, maxtasksperchild=1)
+
+        return self._catalogWorkerPool
+
+    def closeCatalogWorkerPool(self):
+        if self._catalogWorkerPool is not None:
+            self._catalogWorkerPool.terminate()
+            self._catalogWorkerPool.join()
+            self._catalogWorkerPool = None
+
+        self._pendingCatalog = None
+
+    def grabSeasonData(self, wait=True):
+        """Refreshes season/car/track data from the iRacing main page Javascript
+
+        @param wait: Whether to wait for the new catalog.  If not, it is installed on the scheduler's (IRC's) thread
+            once the worker has parsed it.
+        """
 
-    def grabSeasonData(self):
-        """Refreshes season/car/track data from the iRacing main page Javascript"""
         rawMainPageHTML = self.iRacingConnection.fetchMainPageRawHTML()
 
         if rawMainPageHTML is None:
             logger.warning('Unable to fetch iRacing homepage data.')
             return
 
-        self.lastSeasonDataFetchTime = time.time()
+        fetchTime = time.time()
+        pool = self.catalogWorkerPool()
+        result = pool.apply_async(parseCatalog, (rawMainPageHTML,))
+
+        if wait:
+            try:
+                catalog = result.get(self.SECONDS_TO_WAIT_FOR_CATALOG)
+            except Exception as e:
+                logger.error('Unable to parse the iRacing main page catalog: %s', e)
+                return
+
+            self._installCatalog(catalog, fetchTime)
+
+        else:
+            # Checked by collectPendingCatalog on the scheduler's (IRC's) thread, where errors are logged too; the
+            #  pool drops a failed task's exception on the floor, so a callback would only ever hear of successes
+            self._pendingCatalog = (result, fetchTime)
+
+    def collectPendingCatalog(self):
+        """Installs the catalog being parsed in the background, if it is ready.  Returns whether one is still being
+        parsed."""
+        if self._pendingCatalog is None:
+            return False
+
+        result, fetchTime = self._pendingCatalog
+
+        if not result.ready():
+            if time.time() - fetchTime < self.SECONDS_TO_WAIT_FOR_CATALOG:
+                return True
+
+            logger.error('Gave up on the iRacing main page catalog after %i seconds.', self.SECONDS_TO_WAIT_FOR_CATALOG)
+            self._pendingCatalog = None
+            self.closeCatalogWorkerPool()
+            return False
+
+        self._pendingCatalog = None
 
         try:
-            trackJSON = re.search("var TrackListing\\s*=\\s*extractJSON\\('(.*)'\\);", rawMainPageHTML).group(1)
-            carJSON = re.search("var CarListing\\s*=\\s*extractJSON\\('(.*)'\\);", rawMainPageHTML).group(1)
-            carClassJSON = re.search("var CarClassListing\\s*=\\s*extractJSON\\('(.*)'\\);", rawMainPageHTML).group(1)
-            seasonJSON = re.search("var SeasonListing\\s*=\\s*extractJSON\\('(.*)'\\);", rawMainPageHTML).group(1)
-
-            tracks = json.loads(trackJSON)
-            cars = json.loads(carJSON)
-            carClasses = json.loads(carClassJSON)
-            seasons = json.loads(seasonJSON)
-
-            for track in tracks:
-                self.tracksByID[track['id']] = track
-            for car in cars:
-                self.carsByID[car['id']] = car
-            for carClass in carClasses:
-                self.carClassesByID[carClass['id']] = carClass
-            for season in seasons:
-                self.seasonsByID[season['seriesid']] = season
-
-            logger.info('Loaded data for %i tracks, %i cars, %i car classes, and %i seasons.', len(self.tracksByID), len(self.carsByID), len(self.carClassesByID), len(self.seasonsByID))
-
-        except AttributeError:
+            catalog = result.get()
+        except Exception as e:
+            logger.exception('Unable to parse the iRacing main page catalog: %s', e)
+            return False
+
+        self._installCatalog(catalog, fetchTime)
+        return False
+
+    def _installCatalog(self, catalog, fetchTime):
+        """Swaps in a newly parsed catalog as a whole
+
+        @type catalog: Catalog
+        @param fetchTime: When the main page it was parsed from was fetched
+        """
+        if catalog is None:
             logger.info('Unable to match track/car/season (one or more) listing regex in iRacing main page data.  It is possible that iRacing changed the JavaScript structure of their main page!  Oh no!')
+            return
 
+        self.lastSeasonDataFetchTime = fetchTime
+        self.tracksByID = catalog.tracksByID
+        self.carsByID = catalog.carsByID
+        self.carClassesByID = catalog.carClassesByID
+        self.seasonsByID = catalog.seasonsByID
+        self.catalog = catalog
+        self.catalogVersion += 1
 
+        logger.info('Loaded data for %i tracks, %i cars, %i car classes, and %i seasons.', len(self.tracksByID), len(self.carsByID), len(self.carClassesByID), len(self.seasonsByID))
 
     def grabData(self, onlineOnly=True):
-        """Refreshes data from iRacing JSON API."""
+        """Refreshes data from iRacing JSON API.  Returns False if iRacing could not be reached, leaving the last good
+        data (see driverDataAge) in place."""
+
+        # A catalog the worker is still parsing will be along shortly; do not ask for another
+        isCatalogPending = self.collectPendingCatalog()
 
         # Have we loaded the car/track/season data recently?
         timeSinceSeasonDataFetch = sys.maxint if self.lastSeasonDataFetchTime is None else time.time() - self.lastSeasonDataFetchTime
         shouldFetchSeasonData = timeSinceSeasonDataFetch >= self.SECONDS_BETWEEN_CACHING_SEASON_DATA
 
-        # TODO: Check if a new season has started more recently than the past 12 hours.
+        if isCatalogPending:
+            logger.debug('Still waiting for the worker to parse the iRacing main page.')
 
-        if shouldFetchSeasonData:
+        elif shouldFetchSeasonData:
             logTime = 'forever' if self.lastSeasonDataFetchTime is None else '%s seconds' % timeSinceSeasonDataFetch
             logger.info('Fetching iRacing main page season data since it has been %s since we\'ve done so.', logTime)
-            self.grabSeasonData()
+            self.grabSeasonData(wait=not self.refreshCatalogInBackground)
+
+        elif self.raceWeekStartedSinceSeasonDataFetch():
+            logger.info('Fetching iRacing main page season data since a new race week has started.')
+            self.grabSeasonData(wait=not self.refreshCatalogInBackground)
 
         json = self.iRacingConnection.fetchDriverStatusJSON(onlineOnly=onlineOnly)
 
         if json is None:
             # This is already logged in fetchDriverStatusJSON
-            return
+            return False
+
+        self.lastDriverDataTime = time.time()
+        racersJSON = json['fsRacers']
+
+        if self.driverStateStore is not None:
+            racersJSON = self.driverStateStore.load(racersJSON)
 
         # Populate drivers and sessions dictionaries
-        for racerJSON in json['fsRacers']:
+        for racerJSON in racersJSON:
             driverID = Driver.driverIDWithJson(racerJSON)
 
             # Check if we already have data for this driver to update
@@ -399,6 +977,40 @@ class IRacingData:
                 driver = Driver(racerJSON, self.db, self)
                 self.driversByID[driver.id] = driver
 
+        return True
+
+    def registrationAlerts(self):
+        """A RegistrationAlert for every driver in a session who allows them"""
+        alerts = []
+
+        for driver in self.driversByID.values():
+            session = driver.currentSession
+
+            if session is None:
+                continue
+
+            if not driver.allowOnlineQuery or not driver.allowRaceAlerts:
+                # This guy does not want to be spied
+                continue
+
+            alerts.append(RegistrationAlert(driver, session))
+
+        return alerts
+
+    @property
+    def driverDataAge(self):
+        """Seconds since driver data was last fetched successfully, or None if it never has been"""
+        return None if self.lastDriverDataTime is None else time.time() - self.lastDriverDataTime
+
+    def raceWeekStartedSinceSeasonDataFetch(self):
+        if self.lastSeasonDataFetchTime is None:
+            return False
+
+        # The catalog's start times rather than its calendar, which is only built once something asks for it
+        startTimes = self.catalog.raceWeekStartTimes
+        index = bisect.bisect_right(startTimes, self.lastSeasonDataFetchTime)
+        return index < len(startTimes) and startTimes[index] <= time.time()
+
     def onlineDrivers(self):
         """Returns an array of all online Driver()s"""
         drivers = []
@@ -415,30 +1027,147 @@ class IRacingData:
 
         return None
 
+class CaptureLog(object):
+    """Append-only, gzipped log of iRacing responses, one JSON object per line, for replaying later (see replay.py.)
+
+    Every append writes a new gzip member, which gzip readers treat as one continuous stream, so the log survives the
+    bot being killed mid-write of anything but the last record."""
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def append(self, url, body, timestamp=None):
+        record = {
+            'time': time.time() if timestamp is None else timestamp,
+            'url': url,
+            'body': body
+        }
+
+        with gzip.open(self.filename, 'ab') as logFile:
+            logFile.write(json.dumps(record) + '\n')
+
+    def records(self):
+        """Yields every record in the log, oldest first, stopping quietly at a truncated final record"""
+
+        with gzip.open(self.filename, 'rb') as logFile:
+            try:
+                for line in logFile:
+                    yield json.loads(line)
+
+            except (IOError, EOFError, ValueError) as e:
+                logger.warning('Capture log %s ends with a damaged record: %s', self.filename, e)
+
+class CircuitBreaker(object):
+    """Keeps us from hammering iRacing while it is failing.
+
+    After FAILURE_THRESHOLD consecutive failures the breaker opens and requests are refused without touching the
+    network for a delay that doubles each time it reopens, with jitter so that restarts do not all retry in lockstep.
+    Once the delay is up, one request is let through: success closes the breaker, failure opens it again for longer."""
+
+    FAILURE_THRESHOLD = 3
+    BASE_DELAY_SECONDS = 60
+    MAX_DELAY_SECONDS = 1800        # 30 minutes
+
+    def __init__(self, name):
+        self.name = name
+        self.consecutiveFailures = 0
+        self.openCount = 0
+        self.openUntil = None
+
+    @property
+    def isOpen(self):
+        return self.openUntil is not None and time.time() < self.openUntil
+
+    def allowRequest(self):
+        return not self.isOpen
+
+    def recordSuccess(self):
+        if self.openCount > 0:
+            logger.info('%s is responding again.', self.name)
+
+        self.consecutiveFailures = 0
+        self.openCount = 0
+        self.openUntil = None
+
+    def recordFailure(self):
+        self.consecutiveFailures += 1
+
+        if self.consecutiveFailures < self.FAILURE_THRESHOLD:
+            return
+
+        delay = min(self.MAX_DELAY_SECONDS, self.BASE_DELAY_SECONDS * 2 ** self.openCount)
+        delay = random.uniform(delay / 2.0, delay)
+
+        self.openCount += 1
+        self.openUntil = time.time() + delay
+        logger.warning('%s has failed %i times in a row.  Not trying again for %i seconds.', self.name,
+                       self.consecutiveFailures, delay)
+
 class IRacingConnection(object):
 
     URL_GET_DRIVER_STATUS = 'http://members.iracing.com/membersite/member/GetDriverStatus'
     URL_MAIN_PAGE = 'http://members.iracing.com/membersite/member/Home.do'
+    URL_LOGIN = 'https://members.iracing.com/membersite/Login'
+
+    # Responses from these endpoints are written to the capture log, if there is one
+    CAPTURED_URLS = (URL_GET_DRIVER_STATUS, URL_MAIN_PAGE)
+
+    # (connect, read) timeouts in seconds.  These bound how long a tick can be stuck waiting on iRacing.
+    DEFAULT_TIMEOUT = (5, 20)
+    TIMEOUTS_BY_URL = {
+        URL_GET_DRIVER_STATUS: (5, 15),
+        URL_MAIN_PAGE: (5, 30),     # ~550 KB
+        URL_LOGIN: (5, 20)
+    }
+
+    # We only ever talk to one host, a request or two at a time
+    POOL_CONNECTIONS = 2
+    POOL_MAX_SIZE = 4
+
+    HEADERS = {
+        'User-Agent' : 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.17 (KHTML, like Gecko) Chrome/24.0.1312.52 Safari/537.17',
+        'Host': 'members.iracing.com',
+        'Origin': 'members.iracing.com',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection' : 'keep-alive'
+    }
 
     def __init__(self, username, password):
-        self.session = requests.Session()
-
         if len(username) == 0 or len(password) == 0:
             logger.error('Username (%s) or password is missing', username)
             raise NoCredentialsException('Both username and password must be specified when creating an IracingConnection')
 
         self.username = username
         self.password = password
+        self._session = None
+        self.circuitBreaker = CircuitBreaker('iRacing')
 
-        headers = {
-            'User-Agent' : 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.17 (KHTML, like Gecko) Chrome/24.0.1312.52 Safari/537.17',
-            'Host': 'members.iracing.com',
-            'Origin': 'members.iracing.com',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Connection' : 'keep-alive'
-        }
+        # Set to a CaptureLog to record responses for replay
+        self.captureLog = None
+
+    @property
+    def session(self):
+        """The requests.Session, built (and requests imported) on first use rather than at plugin load"""
+        if self._session is None:
+            requests = importRequests()
+            self._session = requests.Session()
+            self._session.headers.update(self.HEADERS)
 
-        self.session.headers.update(headers)
+            # Retries are ours to decide (see CircuitBreaker), not urllib3's
+            adapter = requests.adapters.HTTPAdapter(pool_connections=self.POOL_CONNECTIONS,
+                                                    pool_maxsize=self.POOL_MAX_SIZE, max_retries=0)
+            self._session.mount('http://', adapter)
+            self._session.mount('https://', adapter)
+
+        return self._session
+
+    def timeoutForURL(self, url):
+        for urlPrefix, timeout in self.TIMEOUTS_BY_URL.items():
+            if url.startswith(urlPrefix):
+                return timeout
+
+        return self.DEFAULT_TIMEOUT
 
     def login(self):
 
@@ -451,15 +1180,17 @@ class IRacingConnection(object):
         }
 
         try:
-            response = self.session.post("https://members.iracing.com/membersite/Login", data=loginData)
+            response = self.session.post(self.URL_LOGIN, data=loginData, timeout=self.timeoutForURL(self.URL_LOGIN))
 
         except Exception as e:
+            # Not a breaker failure by itself; requestURL records one for the request that needed the login
             logger.warning("Caught exception logging in: " + str(e))
             return None
 
         return response
 
     def responseRequiresAuthentication(self, response):
+        requests = importRequests()
 
         if response.status_code != requests.codes.ok:
             return True
@@ -470,31 +1201,52 @@ class IRacingConnection(object):
 
         return False
 
-    def requestURL(self, url):
-        # Use a needsRetry flag in case we catch a login failure outside of the SSL exception we seem to always get
-        needsRetry = False
-        response = None
+    def _get(self, url):
+        """GETs url, returning (response, needsLogin).  response is None if the request failed outright."""
+        requests = importRequests()
 
         try:
-            response = self.session.get(url, verify=True)
+            response = self.session.get(url, verify=True, timeout=self.timeoutForURL(url))
             logger.debug("Request to " + url + " returned code " + str(response.status_code))
-            needsRetry = self.responseRequiresAuthentication(response)
+            return response, self.responseRequiresAuthentication(response)
 
-        except Exception as e:
+        except requests.exceptions.SSLError as e:
             # If this is an SSL error, we may be being redirected to the login page
+            logger.info("Caught SSL exception on " + url + " request." + str(e))
+            return None, True
+
+        except Exception as e:
+            # Timeouts and connection failures: iRacing is down or unreachable, and logging in will not help
             logger.info("Caught exception on " + url + " request." + str(e))
-            needsRetry = True
+            return None, False
+
+    def requestURL(self, url):
+        if not self.circuitBreaker.allowRequest():
+            logger.debug("Not requesting " + url + " while iRacing is failing.")
+            return None
 
-        if needsRetry:
+        response, needsLogin = self._get(url)
+
+        if needsLogin:
             logger.info("Logging in...")
-            response = self.login()
 
-        if response != None and not self.responseRequiresAuthentication(response):
-            logger.info("Request returned " + str(response.status_code) + " status code")
+            if self.login() is not None:
+                response, needsLogin = self._get(url)
+
+        if response is None or needsLogin:
+            self.circuitBreaker.recordFailure()
+            return None
 
-            return response
+        self.circuitBreaker.recordSuccess()
+        logger.info("Request returned " + str(response.status_code) + " status code")
 
-        return None
+        if self.captureLog is not None and url.startswith(self.CAPTURED_URLS):
+            try:
+                self.captureLog.append(url, response.text)
+            except Exception as e:
+                logger.warning('Unable to write to capture log %s: %s', self.captureLog.filename, e)
+
+        return response
 
     def fetchMainPageRawHTML(self):
         """Fetches raw HTML that can be used to scrape various Javascript vars that list tracks/cars/series/etc
@@ -520,44 +1272,111 @@ class IRacingConnection(object):
 
 class RacebotDB(object):
 
+    # Schema migrations, applied in order on startup.  The database's user_version is the number of migrations that
+    #  have been applied to it.  Only ever append to this list; changing a migration that has shipped will leave
+    #  existing databases behind.
+    MIGRATIONS = [
+        # 1: The original drivers table.  Databases created before migrations existed already have it (at version 0.)
+        ["""CREATE TABLE IF NOT EXISTS `drivers` (
+            `id`	INTEGER NOT NULL UNIQUE,
+            `real_name`	TEXT,
+            `nick`	TEXT,
+            `allow_nick_reveal`	INTEGER DEFAULT 1,
+            `allow_name_reveal`	INTEGER DEFAULT 0,
+            `allow_race_alerts`	INTEGER DEFAULT 1,
+            `allow_online_query`	INTEGER DEFAULT 1,
+            PRIMARY KEY(id)
+            )
+            """],
+
+        # 2: Reverse lookups from IRC nick or iRacing name to driver, and lookups of drivers by alert preferences
+        ["""CREATE INDEX IF NOT EXISTS `drivers_nick` ON `drivers` (`nick` COLLATE NOCASE)""",
+         """CREATE INDEX IF NOT EXISTS `drivers_real_name` ON `drivers` (`real_name` COLLATE NOCASE)""",
+         """CREATE INDEX IF NOT EXISTS `drivers_alert_preferences` ON `drivers` (`allow_race_alerts`, `allow_online_query`)"""],
+
+        # 3: Per-user subscriptions to a driver, series or track (see SubscriptionIndex)
+        ["""CREATE TABLE IF NOT EXISTS `subscriptions` (
+            `network`	TEXT NOT NULL,
+            `nick`	TEXT NOT NULL,
+            `kind`	TEXT NOT NULL,
+            `target_id`	INTEGER NOT NULL,
+            PRIMARY KEY(network, nick, kind, target_id)
+            )
+            """],
+    ]
+
+    # Seconds a connection will wait on a locked database before giving up
+    BUSY_TIMEOUT_SECONDS = 10.0
+
+    # The drivers table's columns, in export order, with the value a new driver gets when an import leaves one out
+    DRIVER_COLUMN_DEFAULTS = (('id', None), ('real_name', None), ('nick', None), ('allow_nick_reveal', 1),
+                              ('allow_name_reveal', 0), ('allow_race_alerts', 1), ('allow_online_query', 1))
+    DRIVER_INTEGER_COLUMNS = ('id', 'allow_nick_reveal', 'allow_name_reveal', 'allow_race_alerts', 'allow_online_query')
+
     def __init__(self, filename):
         self.filename = filename
 
-        if filename == ':memory:' or not os.path.exists(filename):
-            self._createDatabase()
+        # Bumped whenever a driver's nick or preferences change so that cached renderings can be thrown away
+        self.preferencesVersion = 0
 
-    def _createDatabase(self):
-        db = sqlite3.connect(self.filename)
+        self._migrate()
 
-        try:
-            cursor = db.cursor()
+    @property
+    def schemaVersion(self):
+        return len(self.MIGRATIONS)
 
-            cursor.execute("""CREATE TABLE `drivers` (
-                            `id`	INTEGER NOT NULL UNIQUE,
-                            `real_name`	TEXT,
-                            `nick`	TEXT,
-                            `allow_nick_reveal`	INTEGER DEFAULT 1,
-                            `allow_name_reveal`	INTEGER DEFAULT 0,
-                            `allow_race_alerts`	INTEGER DEFAULT 1,
-                            `allow_online_query`	INTEGER DEFAULT 1,
-                            PRIMARY KEY(id)
-                            )
-                            """)
+    def _migrate(self):
+        """Brings the database up to the current schema version, creating it if needed, and switches it to WAL"""
+        db = self._getDB()
+
+        try:
+            if self.filename != ':memory:':
+                # WAL lets command threads read while the tick writes.  This setting sticks to the database file.
+                db.execute('PRAGMA journal_mode = WAL')
+
+            version = db.execute('PRAGMA user_version').fetchone()[0]
+
+            # Manage transactions ourselves so that each migration and its version bump are applied atomically
+            db.isolation_level = None
+
+            for migrationIndex in range(version, len(self.MIGRATIONS)):
+                db.execute('BEGIN')
+
+                try:
+                    for statement in self.MIGRATIONS[migrationIndex]:
+                        db.execute(statement)
+
+                    db.execute('PRAGMA user_version = %d' % (migrationIndex + 1))
+                    db.execute('COMMIT')
+
+                except Exception:
+                    db.execute('ROLLBACK')
+                    raise
+
+                logger.info('Migrated database %s to schema version %i', self.filename, migrationIndex + 1)
 
-            db.commit()
-            logger.info("Created database and drivers table")
         finally:
             db.close()
 
-
     def _getDB(self):
-        db = sqlite3.connect(self.filename)
+        db = sqlite3.connect(self.filename, timeout=self.BUSY_TIMEOUT_SECONDS)
+
+        # With WAL, NORMAL only risks the last transactions on power loss, never corruption, and skips most fsyncs
+        db.execute('PRAGMA synchronous = NORMAL')
+        db.execute('PRAGMA temp_store = MEMORY')
+
         return db
 
     def persistDriver(self, driver, nick=None, allowNickReveal=None, allowNameReveal=None, allowRaceAlerts=None, allowOnlineQuery=None):
         """
         @type driver: Driver
         """
+        # Not any(): supybot.commands replaces it with a converter
+        changes = [(column, value) for column, value in (('nick', nick), ('allow_nick_reveal', allowNickReveal),
+                                                         ('allow_name_reveal', allowNameReveal),
+                                                         ('allow_race_alerts', allowRaceAlerts),
+                                                         ('allow_online_query', allowOnlineQuery))
+                   if value is not None]
         db = self._getDB()
 
         try:
@@ -566,47 +1385,235 @@ class RacebotDB(object):
             cursor.execute("""INSERT OR IGNORE INTO drivers (id, real_name) VALUES (?, ?)""",
                           (driver.id, driver.name))
 
-            if nick is not None:
-                cursor.execute("""UPDATE drivers SET nick = ? WHERE id = ?""", (nick, driver.id))
+            if changes:
+                assignments = ', '.join('%s = ?' % column for column, value in changes)
+                cursor.execute('UPDATE drivers SET %s WHERE id = ?' % assignments,
+                               [value for column, value in changes] + [driver.id])
+
+            db.commit()
 
-            if allowNickReveal is not None:
-                cursor.execute("""UPDATE drivers SET allow_nick_reveal = ? WHERE id = ?""", (allowNickReveal, driver.id))
+        finally:
+            db.close()
 
-            if allowNameReveal is not None:
-                cursor.execute("""UPDATE drivers SET allow_name_reveal = ? WHERE id = ?""", (allowNameReveal, driver.id))
+        if changes:
+            self.preferencesVersion += 1
+
+    def exportDrivers(self, outputFile, fileFormat='csv'):
+        """Writes every row of the drivers table to outputFile, one at a time, and returns how many there were.
+
+        @param fileFormat: 'csv' (with a header row) or 'json' (one object per line)
+        """
+
+        columns = [column for column, default in self.DRIVER_COLUMN_DEFAULTS]
+        db = self._getDB()
+        count = 0
 
-            if allowRaceAlerts is not None:
-                cursor.execute("""UPDATE drivers SET allow_race_alerts = ? WHERE id = ?""", (allowRaceAlerts, driver.id))
+        try:
+            rows = db.execute('SELECT %s FROM drivers ORDER BY id' % ', '.join(columns))
+
+            if fileFormat == 'csv':
+                writer = csv.writer(outputFile)
+                writer.writerow(columns)
+
+            for row in rows:
+                if fileFormat == 'csv':
+                    writer.writerow(['' if value is None else unicode(value).encode('utf-8') for value in row])
+                else:
+                    outputFile.write(json.dumps(dict(zip(columns, row)), sort_keys=True) + '\n')
+
+                count += 1
+
+        finally:
+            db.close()
+
+        return count
+
+    def _importedDriverRows(self, inputFile, fileFormat):
+        """Yields each driver in inputFile (see exportDrivers) as a dict of every column, None where it is missing or
+        empty, along with <column>_given for whether the driver had the column at all"""
+
+        if fileFormat == 'csv':
+            records = csv.DictReader(inputFile)
+        else:
+            records = (json.loads(line) for line in inputFile if line.strip())
+
+        for lineNumber, record in enumerate(records, 1):
+            row = {}
+
+            for column, default in self.DRIVER_COLUMN_DEFAULTS:
+                # exportDrivers writes NULL as '' in CSV and null in JSON; either means NULL, unlike leaving it out
+                row[column + '_given'] = column in record and not (fileFormat == 'csv' and record[column] is None)
+                value = record.get(column)
+
+                if isinstance(value, str):
+                    value = value.decode('utf-8')
+
+                if value == '':
+                    value = None
+
+                if value is not None and column in self.DRIVER_INTEGER_COLUMNS:
+                    try:
+                        value = int(value)
+                    except ValueError:
+                        raise ValueError('Driver %i has %s %r, which is not a number' % (lineNumber, column, value))
+
+                row[column] = value
+
+            if row['id'] is None:
+                raise ValueError('Driver %i has no id' % lineNumber)
+
+            yield row
+
+    def importDrivers(self, inputFile, fileFormat='csv'):
+        """Adds or updates every driver in inputFile, as written by exportDrivers, in one transaction, and returns how
+        many there were.  Columns that a driver leaves out keep their current value (or get the default, for a new
+        driver), and empty ones are cleared, so importing an export restores it exactly.  Nothing is imported if any
+        driver is invalid.
+
+        @param fileFormat: 'csv' or 'json'
+        """
+        columns = [column for column, default in self.DRIVER_COLUMN_DEFAULTS]
+        values = ['CASE WHEN :%s_given THEN :%s ELSE COALESCE(existing.%s, %s) END'
+                  % (column, column, column, 'NULL' if default is None else default)
+                  for column, default in self.DRIVER_COLUMN_DEFAULTS]
 
-            if allowOnlineQuery is not None:
-                cursor.execute("""UPDATE drivers SET allow_online_query = ? WHERE id = ?""", (allowOnlineQuery, driver.id))
+        # One statement per driver, which executemany can stream the file through, instead of an insert and an update
+        statement = ('INSERT OR REPLACE INTO drivers (%s) SELECT %s FROM (SELECT :id AS id) AS imported '
+                     'LEFT JOIN drivers AS existing ON existing.id = imported.id') % (', '.join(columns), ', '.join(values))
 
+        count = [0]
+
+        def countedRows():
+            for row in self._importedDriverRows(inputFile, fileFormat):
+                count[0] += 1
+                yield row
+
+        db = self._getDB()
+
+        try:
+            db.executemany(statement, countedRows())
             db.commit()
 
         finally:
+            # Closing without committing rolls back whatever was imported before an error
             db.close()
 
+        self.preferencesVersion += 1
+        return count[0]
+
     def _rowForDriver(self, driver):
         """
         @param driver: Driver
         """
+        return self.rowForDriverID(driver.id)
 
+    def rowForDriverID(self, driverID):
+        return self._rowWhere('id = ?', (driverID,))
+
+    def _rowWhere(self, condition, parameters):
         db = self._getDB()
 
         try:
             cursor = db.cursor()
             cursor.row_factory = sqlite3.Row
-            result = cursor.execute('SELECT * FROM drivers WHERE id=?', (driver.id,))
-            row = result.fetchone()
+            row = cursor.execute('SELECT * FROM drivers WHERE ' + condition, parameters).fetchone()
 
         finally:
             db.close()
 
         return row
 
+    def rowForNick(self, nick):
+        """The drivers row linked to an IRC nick (case insensitive), or None"""
+        return self._rowWhere('nick = ? COLLATE NOCASE', (nick,))
+
+    def rowForDriverName(self, name):
+        """The drivers row for an iRacing name as shown by iRacing (case insensitive, spaces or +s), or None.  iRacing
+        URL encodes names with accents (J%C3%B6rg+M%C3%BCller), so either spelling matches."""
+        name = decodeIrcArgument(name)
+        encodedName = urllib.quote_plus(name.encode('utf-8')).decode('ascii')
+        return self._rowWhere('real_name IN (?, ?) COLLATE NOCASE', (name.replace(' ', '+'), encodedName))
+
+    def linkNickToDriverID(self, nick, driverID):
+        """Sets the nick for a known driver, unlinking it from any other driver that had it"""
+        db = self._getDB()
+
+        try:
+            cursor = db.cursor()
+            cursor.execute("""UPDATE drivers SET nick = NULL WHERE nick = ? COLLATE NOCASE AND id != ?""", (nick, driverID))
+            cursor.execute("""UPDATE drivers SET nick = ? WHERE id = ?""", (nick, driverID))
+            db.commit()
+
+        finally:
+            db.close()
+
+        self.preferencesVersion += 1
+
+    def unlinkNick(self, nick):
+        """Clears nick from whichever driver has it.  Returns whether one did."""
+        db = self._getDB()
+
+        try:
+            cursor = db.execute("""UPDATE drivers SET nick = NULL WHERE nick = ? COLLATE NOCASE""", (nick,))
+            db.commit()
+            unlinked = cursor.rowcount > 0
+
+        finally:
+            db.close()
+
+        if unlinked:
+            self.preferencesVersion += 1
+
+        return unlinked
+
+    def subscriptions(self):
+        """Every subscription, as (network, nick, kind, target ID) tuples"""
+        db = self._getDB()
+
+        try:
+            return db.execute('SELECT network, nick, kind, target_id FROM subscriptions').fetchall()
+
+        finally:
+            db.close()
+
+    def subscriptionsForNick(self, network, nick):
+        """(kind, target ID) tuples for everything nick on network is subscribed to"""
+        db = self._getDB()
+
+        try:
+            return db.execute('SELECT kind, target_id FROM subscriptions WHERE network = ? AND nick = ? ORDER BY kind',
+                              (network, nick)).fetchall()
+
+        finally:
+            db.close()
+
+    def addSubscriptions(self, network, nick, kind, targetIDs):
+        db = self._getDB()
+
+        try:
+            db.executemany('INSERT OR IGNORE INTO subscriptions (network, nick, kind, target_id) VALUES (?, ?, ?, ?)',
+                           [(network, nick, kind, targetID) for targetID in targetIDs])
+            db.commit()
+
+        finally:
+            db.close()
+
+    def removeSubscriptions(self, network, nick, kind, targetIDs):
+        """Returns the number of subscriptions removed"""
+        db = self._getDB()
+
+        try:
+            cursor = db.executemany('DELETE FROM subscriptions WHERE network = ? AND nick = ? AND kind = ? AND target_id = ?',
+                                    [(network, nick, kind, targetID) for targetID in targetIDs])
+            db.commit()
+            return cursor.rowcount
+
+        finally:
+            db.close()
+
     def nickForDriver(self, driver):
         row = self._rowForDriver(driver)
-        return None if (row is None or 'nick' not in row) else row['nick']
+        return None if row is None else row['nick']
 
     def allowNickRevealForDriver(self, driver):
         row = self._rowForDriver(driver)
@@ -635,59 +1642,195 @@ class Racebot(callbacks.Plugin):
     SCHEDULER_INTERVAL_SECONDS = 300.0     # Every five minutes
     DATABASE_FILENAME = 'racebot_db.sqlite3'
     NO_ONE_ONLINE_RESPONSE = 'No one is racing :('
+    UNREACHABLE_RESPONSE = 'I cannot reach iRacing right now :('
+    WARMING_UP_RESPONSE = 'Still starting up.  Try again in a moment.'
+    WARM_UP_THREAD_NAME = 'RacebotWarmUp'
+    UPCOMING_WINDOW_SECONDS = 3600      # upcoming lists what starts within the next hour
+    MAX_SEARCH_RESULTS = 10
 
     def __init__(self, irc):
         self.__parent = super(Racebot, self)
         self.__parent.__init__(irc)
 
-        db = RacebotDB(self.DATABASE_FILENAME)
-
+        # Registration phase: only cheap work happens here, on the thread that talks to IRC.  Opening the database,
+        #  logging in and loading the catalog are deferred to _warmUp().
         username = self.registryValue('iRacingUsername')
         password = self.registryValue('iRacingPassword')
 
         connection = IRacingConnection(username, password)
-        self.iRacingData = IRacingData(connection, db)
+        captureFilename = self.registryValue('captureFilename')
+
+        if captureFilename:
+            connection.captureLog = CaptureLog(captureFilename)
+
+        self.iRacingData = IRacingData(connection, None)
+        self.iRacingData.refreshCatalogInBackground = not world.testing
+
+        if self.registryValue('skipIdleDrivers'):
+            self.iRacingData.driverStateStore = DriverStateStore()
+        self.subscriptionIndex = SubscriptionIndex()
+        self.memoryMonitor = None
+        self.statusServer = None
+        self._publishedCatalogVersion = None
+        self._warmedUp = threading.Event()
+
+        if world.testing:
+            self._warmUp()
+        else:
+            warmUpThread = threading.Thread(target=self._warmUp, name=self.WARM_UP_THREAD_NAME)
+            warmUpThread.setDaemon(True)
+            world.threadsSpawned += 1
+            warmUpThread.start()
 
         # Check for newly registered racers every x time, (initially five minutes.)
         # This should perhaps ramp down in frequency during non-registration times and ramp up a few minutes
         #  before race start times (four times per hour.)  For now, we fire every five minutes.
+        # One poll per tick, whichever and however many networks we are on; see doBroadcastTick.
         def scheduleTick():
-            self.doBroadcastTick(irc)
+            self.doBroadcastTick()
         schedule.addPeriodicEvent(scheduleTick, self.SCHEDULER_INTERVAL_SECONDS, self.SCHEDULER_TASK_NAME)
 
+    def _warmUp(self):
+        """Warm-up phase: opens (or creates) the database, logs in and loads the car/track/season catalog"""
+        startTime = time.time()
+
+        try:
+            self.iRacingData.db = RacebotDB(self.DATABASE_FILENAME)
+            self.subscriptionIndex = SubscriptionIndex(self.iRacingData.db.subscriptions())
+            self.iRacingData.iRacingConnection.login()
+            self.iRacingData.grabSeasonData()
+            self._startStatusServer()
+        except Exception as e:
+            logger.exception('Racebot warm-up failed: %s', e)
+
+        finally:
+            if self.iRacingData.db is None:
+                logger.error('Racebot has no database and will not be able to do anything useful.')
+            else:
+                self._warmedUp.set()
+
+        logger.info('Racebot warm-up took %.2f seconds.', time.time() - startTime)
+
+    @property
+    def isWarmedUp(self):
+        return self._warmedUp.isSet()
+
     def die(self):
         schedule.removePeriodicEvent(self.SCHEDULER_TASK_NAME)
+
+        if self.memoryMonitor is not None:
+            self.memoryMonitor.stop()
+
+        if self.statusServer is not None:
+            self.statusServer.stop()
+            self.statusServer = None
+
+        # Our own IRacingData's, not IRacingData's: on reload, that name is already the reloaded class
+        self.iRacingData.closeCatalogWorkerPool()
         self.__parent.die()
 
-    def doBroadcastTick(self, irc):
+    def _startStatusServer(self):
+        """Starts serving status over HTTP if a port is configured"""
+        port = self.registryValue('statusServerPort')
 
-        # Refresh data
-        self.iRacingData.grabData()
+        if port == 0:
+            return
 
-        # Loop through all drivers, looking for those in sessions
-        for (_, aDriver) in self.iRacingData.driversByID.items():
-            driver = aDriver    # After 15 minutes of struggling to get pycharm to recognize driver as a Driver object,
-                                #  this stupid reassignment to a redundant var made it happy.  <3 Python
-            """:type : Driver"""
-            session = driver.currentSession()
-            """:type : Session"""
+        import statusserver
 
-            if session is None:
-                continue
+        try:
+            self.statusServer = statusserver.StatusServer(self.registryValue('statusServerHost'), port,
+                                                          statusserver.StatusPublisher())
+        except Exception as e:
+            logger.error('Could not start the Racebot status server on port %i: %s', port, e)
+            return
 
-            if not driver.allowOnlineQuery or not driver.allowRaceAlerts:
-                # This guy does not want to be spied
-                continue
+        self.statusServer.start()
+        self._publishStatus()
+
+    def _publishStatus(self):
+        """Rebuilds the documents the status server serves from our current data"""
+        if self.statusServer is None:
+            return
+
+        import statusserver
+        publisher = self.statusServer.publisher
+
+        if self.iRacingData.catalogVersion != self._publishedCatalogVersion:
+            publisher.publish(statusserver.CATALOGS_PATH, statusserver.catalogsPayload(self.iRacingData))
+            self._publishedCatalogVersion = self.iRacingData.catalogVersion
+
+        if self.iRacingData.lastDriverDataTime is not None:
+            publisher.publish(statusserver.DRIVERS_PATH, statusserver.driversPayload(self.iRacingData))
+
+    def _connectedIrcs(self):
+        """Every network we are connected to.  Plugins are shared by all of them, so one of us serves them all."""
+        return [irc for irc in world.ircs if not getattr(irc, 'zombie', False)]
+
+    def doBroadcastTick(self, irc=None, racingData=None):
+        """Polls iRacing once and announces registrations in every channel that wants them.
+
+        @param irc: The only Irc to announce to.  By default, every connected network gets the announcements.
+        @type racingData: IRacingData
+        @param racingData: Data to refresh and broadcast from.  Our own, unless we are replaying a capture.
+        """
+
+        if not self.isWarmedUp:
+            logger.info('Skipping broadcast tick because Racebot is still warming up.')
+            return
+
+        if racingData is None:
+            racingData = self.iRacingData
+
+        # Refresh data.  If iRacing could not be reached there is nothing new to announce.
+        if not racingData.grabData():
+            return
+
+        alerts = racingData.registrationAlerts()
+        ircs = [irc] if irc is not None else self._connectedIrcs()
+        announcements = set()
+
+        for anIrc in ircs:
+            for channel in anIrc.state.channels:
+                for alert in alerts:
+                    relevantConfigValue = 'raceRegistrationAlerts' if alert.isRace else 'nonRaceRegistrationAlerts'
+
+                    if self.registryValue(relevantConfigValue, channel, anIrc.network):
+                        announcement = (anIrc.network, channel, alert.driver.id, alert.session.subSessionId)
+                        announcements.add(announcement)
+
+                        # Registrations last for many ticks; announce each one once
+                        if announcement not in racingData.channelAnnouncements:
+                            anIrc.queueMsg(ircmsgs.privmsg(channel, alert.message))
+
+        racingData.channelAnnouncements = announcements
+        self._notifySubscribers(alerts, ircs, racingData)
+
+        if racingData is self.iRacingData:
+            self._publishStatus()
+
+            if self.memoryMonitor is not None:
+                self.memoryMonitor.afterTick(self)
+
+    def _notifySubscribers(self, alerts, ircs, racingData):
+        """Privately messages each subscriber once per registration they are subscribed to"""
+        ircsByNetwork = dict((anIrc.network, anIrc) for anIrc in ircs)
+        notifications = set()
 
-            isRaceSession = session.isRaceOrPreRacePractice
+        for alert in alerts:
+            for network, nick in self.subscriptionIndex.subscribersForAlert(alert):
+                anIrc = ircsByNetwork.get(network)
 
-            for channel in irc.state.channels:
-                relevantConfigValue = 'raceRegistrationAlerts' if isRaceSession else 'nonRaceRegistrationAlerts'
-                shouldBroadcast = self.registryValue(relevantConfigValue, channel)
+                if anIrc is None:
+                    continue
 
-                if shouldBroadcast:
-                    message = '%s is registered for a %s' % (driver.nameForPrinting(), session.sessionDescription.lower())
-                    irc.queueMsg(ircmsgs.privmsg(channel, message))
+                notification = (network, nick, alert.driver.id, alert.session.subSessionId)
+                notifications.add(notification)
+
+                if notification not in racingData.subscriptionNotifications:
+                    anIrc.queueMsg(ircmsgs.privmsg(nick, alert.message))
+
+        racingData.subscriptionNotifications = notifications
 
     def racers(self, irc, msg, args):
         """takes no arguments
@@ -697,7 +1840,20 @@ class Racebot(callbacks.Plugin):
 
         logger.info("Command sent by " + str(msg.nick))
 
-        self.iRacingData.grabData()
+        if not self.isWarmedUp:
+            irc.reply(self.WARMING_UP_RESPONSE)
+            return
+
+        isFresh = self.iRacingData.grabData()
+        dataAge = self.iRacingData.driverDataAge
+
+        if isFresh:
+            self._publishStatus()
+
+        if dataAge is None:
+            irc.reply(self.UNREACHABLE_RESPONSE)
+            return
+
         onlineDrivers = self.iRacingData.onlineDrivers()
         onlineDriverNames = []
 
@@ -714,10 +1870,471 @@ class Racebot(callbacks.Plugin):
         else:
             response = 'Online racers: %s' % utils.str.commaAndify(onlineDriverNames)
 
+        if not isFresh:
+            # Serve what we last knew, but say how old it is
+            response += ' (as of %s ago)' % utils.timeElapsed(dataAge)
+
         irc.reply(response)
 
     racers = wrap(racers)
 
+    def link(self, irc, msg, args, nick, name):
+        """<nick> <iRacing name>
+
+        Links <nick> to the iRacing driver with that name.  The driver must be friended or studied by the bot's
+        iRacing account.  Until a driver has a nick, the bot never announces or reveals them, so only admins may link.
+        """
+
+        if not self.isWarmedUp:
+            irc.reply(self.WARMING_UP_RESPONSE)
+            return
+
+        db = self.iRacingData.db
+        name = decodeIrcArgument(name)
+        row = db.rowForDriverName(name)
+
+        if row is None:
+            irc.error('I do not know an iRacing driver named %s.' % name)
+            return
+
+        if row['nick'] is not None and not ircutils.strEqual(row['nick'], nick):
+            irc.error('%s is already linked to %s.' % (name, row['nick']))
+            return
+
+        db.linkNickToDriverID(nick, row['id'])
+        irc.replySuccess()
+
+    link = wrap(link, ['admin', 'nick', 'text'])
+
+    def unlink(self, irc, msg, args, nick):
+        """[<nick>]
+
+        Unlinks <nick> (by default, your own nick) from its iRacing driver, so that the bot stops announcing and
+        revealing them.  Unlinking anyone else requires the admin capability.
+        """
+
+        if not self.isWarmedUp:
+            irc.reply(self.WARMING_UP_RESPONSE)
+            return
+
+        if nick is None:
+            nick = msg.nick
+        elif not ircutils.strEqual(nick, msg.nick) and not ircdb.checkCapability(msg.prefix, 'admin'):
+            irc.errorNoCapability('admin')
+            return
+
+        if not self.iRacingData.db.unlinkNick(nick):
+            irc.error('%s is not linked to an iRacing driver.' % nick)
+            return
+
+        irc.replySuccess()
+
+    unlink = wrap(unlink, [optional('nick')])
+
+    def whois(self, irc, msg, args, nick):
+        """<nick>
+
+        Tells who the iRacing driver linked to <nick> is, and what they are doing right now.
+        """
+
+        if not self.isWarmedUp:
+            irc.reply(self.WARMING_UP_RESPONSE)
+            return
+
+        row = self.iRacingData.db.rowForNick(nick)
+
+        if row is None:
+            irc.reply('I do not know which iRacing driver %s is.' % nick)
+            return
+
+        if row['allow_name_reveal']:
+            response = '%s is %s' % (nick, row['real_name'].replace('+', ' '))
+        else:
+            response = '%s is an iRacing driver who would rather not have their name revealed' % nick
+
+        # Use whatever we learned on the last tick rather than asking iRacing again
+        driver = self.iRacingData.driversByID.get(row['id'])
+
+        if driver is not None and row['allow_online_query'] and driver.isOnline:
+            if driver.currentSession is not None:
+                response += ', currently in a %s' % driver.currentSession.sessionDescription
+            else:
+                response += ', currently online'
+
+        irc.reply(response + '.')
+
+    whois = wrap(whois, ['nick'])
+
+    def upcoming(self, irc, msg, args, seriesName):
+        """[<series>]
+
+        Lists the race weeks starting within the next hour, or what starts next if nothing does.  With <series>,
+        tells when each series whose name starts with <series> next changes tracks.
+        """
+
+        if not self.isWarmedUp:
+            irc.reply(self.WARMING_UP_RESPONSE)
+            return
+
+        calendar = self.iRacingData.calendar
+        now = time.time()
+
+        def describe(raceWeek):
+            return '%s week %i at %s in %s' % (raceWeek.seriesName, raceWeek.raceWeek, raceWeek.trackDescription,
+                                               utils.timeElapsed(raceWeek.startTime - now))
+
+        if seriesName is not None:
+            seriesName = decodeIrcArgument(seriesName)
+            seriesIDs = calendar.seriesIDsWithNamePrefix(seriesName)
+
+            if len(seriesIDs) == 0:
+                irc.error('I do not know of a series called %s.' % seriesName)
+                return
+
+            descriptions = []
+
+            for seriesID in seriesIDs:
+                raceWeek = calendar.nextRaceWeekForSeries(seriesID, now)
+
+                if raceWeek is not None:
+                    descriptions.append(describe(raceWeek))
+
+            if len(descriptions) == 0:
+                irc.reply('Nothing more is scheduled this season for %s.' % seriesName)
+            else:
+                irc.reply(self._commaAndifyAtMost(descriptions))
+
+            return
+
+        raceWeeks = calendar.raceWeeksStartingBetween(now, now + self.UPCOMING_WINDOW_SECONDS)
+
+        if len(raceWeeks) > 0:
+            irc.reply('Starting within the hour: %s' % self._commaAndifyAtMost([describe(raceWeek) for raceWeek in raceWeeks]))
+            return
+
+        nextStartTime = calendar.nextStartTime(now)
+
+        if nextStartTime is None:
+            irc.reply('Nothing more is scheduled this season.')
+            return
+
+        raceWeeks = calendar.raceWeeksStartingBetween(now, nextStartTime)
+        irc.reply('Nothing starts within the hour.  Next up: %s' % self._commaAndifyAtMost([describe(raceWeek) for raceWeek in raceWeeks]))
+
+    upcoming = wrap(upcoming, [optional('text')])
+
+    def _commaAndifyAtMost(self, descriptions):
+        """Every series changes week at the same moment, so lists of them are capped like search results"""
+        if len(descriptions) > self.MAX_SEARCH_RESULTS:
+            descriptions = descriptions[:self.MAX_SEARCH_RESULTS] + ['%i more' % (len(descriptions) - self.MAX_SEARCH_RESULTS)]
+
+        return utils.str.commaAndify(descriptions)
+
+    def _replyWithSearchResults(self, irc, index, query, kind):
+        """
+        @type index: CatalogSearchIndex
+        """
+
+        if not self.isWarmedUp:
+            irc.reply(self.WARMING_UP_RESPONSE)
+            return
+
+        query = decodeIrcArgument(query)
+        matches = index.search(query)
+
+        if len(matches) == 0:
+            irc.reply('I do not know of a %s like %s.' % (kind, query))
+            return
+
+        names = [index.namesByID[entryID] for entryID in matches[:self.MAX_SEARCH_RESULTS]]
+
+        if len(matches) > self.MAX_SEARCH_RESULTS:
+            names.append('%i more' % (len(matches) - self.MAX_SEARCH_RESULTS))
+
+        irc.reply(utils.str.commaAndify(names))
+
+    def track(self, irc, msg, args, query):
+        """<name>
+
+        Finds tracks by name.  Partial words and small typos are fine ("spa", "laguna").
+        """
+        self._replyWithSearchResults(irc, self.iRacingData.trackIndex, query, 'track')
+
+    track = wrap(track, ['text'])
+
+    def car(self, irc, msg, args, query):
+        """<name>
+
+        Finds cars by name or abbreviation.  Partial words and small typos are fine ("mx5", "skip").
+        """
+        self._replyWithSearchResults(irc, self.iRacingData.carIndex, query, 'car')
+
+    car = wrap(car, ['text'])
+
+    def series(self, irc, msg, args, query):
+        """<name>
+
+        Finds series by name.  Partial words and small typos are fine ("skip barber", "blancpain").
+        """
+        self._replyWithSearchResults(irc, self.iRacingData.seriesIndex, query, 'series')
+
+    series = wrap(series, ['text'])
+
+    def _subscriptionTargets(self, irc, kind, name):
+        """Resolves what a user asked to (un)subscribe to.  Returns (description, target IDs), or None after replying
+        with an error."""
+        racingData = self.iRacingData
+        name = decodeIrcArgument(name)
+
+        if kind == 'driver':
+            row = racingData.db.rowForNick(name)
+            description = name
+
+            if row is None:
+                row = racingData.db.rowForDriverName(name)
+                description = None if row is None else row['real_name'].replace('+', ' ')
+
+            if row is None:
+                irc.error('I do not know an iRacing driver or nick called %s.' % name)
+                return None
+
+            return description, [row['id']]
+
+        index = racingData.seriesIndex if kind == 'series' else racingData.trackIndex
+        matches = index.search(name)
+
+        if len(matches) == 0:
+            irc.error('I do not know of a %s like %s.' % (kind, name))
+            return None
+
+        if kind == 'series':
+            return index.namesByID[matches[0]], [matches[0]]
+
+        # Every configuration of the track shares its name, and registrations name a configuration
+        trackName = racingData.tracksByID[matches[0]]['name']
+        trackIDs = [trackID for trackID, track in racingData.tracksByID.items() if track['name'] == trackName]
+        return decodeListingName(trackName), trackIDs
+
+    def _describeSubscription(self, kind, targetID):
+        racingData = self.iRacingData
+
+        if kind == 'series':
+            return racingData.seriesIndex.namesByID.get(targetID, 'series %i' % targetID)
+
+        if kind == 'track':
+            track = racingData.tracksByID.get(targetID)
+            return 'track %i' % targetID if track is None else decodeListingName(track['name'])
+
+        driver = racingData.driversByID.get(targetID)
+
+        if driver is not None:
+            return driver.nameForPrinting()
+
+        row = racingData.db.rowForDriverID(targetID)
+
+        if row is None:
+            return 'driver %i' % targetID
+
+        return row['nick'] if row['nick'] is not None else row['real_name'].replace('+', ' ')
+
+    def subscribe(self, irc, msg, args, kind, name):
+        """<driver|series|track> <name>
+
+        Sends you a private message when a driver registers for a session: a particular driver (by iRacing name or
+        IRC nick), anyone in a series, or anyone at a track.  Only drivers who allow race alerts are announced.  Send
+        this in a private message.
+        """
+
+        if not self.isWarmedUp:
+            irc.reply(self.WARMING_UP_RESPONSE)
+            return
+
+        if ircutils.isChannel(msg.args[0]):
+            irc.error('Please subscribe in a private message.')
+            return
+
+        targets = self._subscriptionTargets(irc, kind, name)
+
+        if targets is None:
+            return
+
+        description, targetIDs = targets
+        nick = ircutils.toLower(msg.nick)
+
+        self.iRacingData.db.addSubscriptions(irc.network, nick, kind, targetIDs)
+
+        for targetID in targetIDs:
+            self.subscriptionIndex.add(irc.network, nick, kind, targetID)
+
+        irc.reply('You will hear about registrations for %s %s.' % (kind, description))
+
+    subscribe = wrap(subscribe, [('literal', SubscriptionIndex.KINDS), 'text'])
+
+    def unsubscribe(self, irc, msg, args, kind, name):
+        """<driver|series|track> <name>
+
+        Stops private messages about a driver, series or track you subscribed to.
+        """
+
+        if not self.isWarmedUp:
+            irc.reply(self.WARMING_UP_RESPONSE)
+            return
+
+        targets = self._subscriptionTargets(irc, kind, name)
+
+        if targets is None:
+            return
+
+        description, targetIDs = targets
+        nick = ircutils.toLower(msg.nick)
+
+        if self.iRacingData.db.removeSubscriptions(irc.network, nick, kind, targetIDs) == 0:
+            irc.error('You are not subscribed to %s %s.' % (kind, description))
+            return
+
+        for targetID in targetIDs:
+            self.subscriptionIndex.remove(irc.network, nick, kind, targetID)
+
+        irc.replySuccess()
+
+    unsubscribe = wrap(unsubscribe, [('literal', SubscriptionIndex.KINDS), 'text'])
+
+    def subscriptions(self, irc, msg, args):
+        """takes no arguments
+
+        Lists the drivers, series and tracks you are subscribed to.
+        """
+
+        if not self.isWarmedUp:
+            irc.reply(self.WARMING_UP_RESPONSE)
+            return
+
+        rows = self.iRacingData.db.subscriptionsForNick(irc.network, ircutils.toLower(msg.nick))
+        descriptions = []
+
+        for kind, targetID in rows:
+            description = '%s %s' % (kind, self._describeSubscription(kind, targetID))
+
+            # Track configurations collapse into one track
+            if description not in descriptions:
+                descriptions.append(description)
+
+        if len(descriptions) == 0:
+            irc.reply('You are not subscribed to anything.')
+        else:
+            irc.reply(utils.str.commaAndify(descriptions))
+
+    subscriptions = wrap(subscriptions)
+
+    def memory(self, irc, msg, args, action):
+        """[start|stop]
+
+        Reports how many objects, and roughly how many bytes, each of Racebot's structures holds.  start watches for
+        growth after every tick (using tracemalloc snapshots, where available) and logs a warning when it exceeds the
+        memoryGrowthWarningBytes config; stop ends that.
+        """
+        import diagnostics
+
+        if not self.isWarmedUp:
+            irc.reply(self.WARMING_UP_RESPONSE)
+            return
+
+        if action == 'start':
+            if self.memoryMonitor is None:
+                self.memoryMonitor = diagnostics.MemoryMonitor(self.registryValue('memoryGrowthWarningBytes'))
+                self.memoryMonitor.start()
+
+            tracing = 'with' if self.memoryMonitor.isTracing else 'without'
+            irc.reply('Watching memory after every tick, %s tracemalloc.' % tracing)
+            return
+
+        if action == 'stop':
+            if self.memoryMonitor is not None:
+                self.memoryMonitor.stop()
+                self.memoryMonitor = None
+
+            irc.replySuccess()
+            return
+
+        irc.reply(diagnostics.summarize(self))
+
+    memory = wrap(memory, ['owner', optional(('literal', ('start', 'stop')))])
+
+    def replay(self, irc, msg, args, filename, speed):
+        """<capture filename> [<speed>]
+
+        Replays a capture log (see the captureFilename config) through a separate copy of the data and the broadcast
+        tick, reporting throughput and what would have been announced.  Nothing is sent to any channel.  <speed> is a
+        multiple of real time; without it, the capture is replayed as fast as possible.
+        """
+        import replay
+
+        if not self.isWarmedUp:
+            irc.reply(self.WARMING_UP_RESPONSE)
+            return
+
+        if not os.path.exists(filename):
+            irc.error('There is no capture log named %s.' % filename)
+            return
+
+        if speed is not None and speed <= 0:
+            irc.error('Speed must be greater than zero.')
+            return
+
+        def doReplay():
+            try:
+                result = replay.replayCapture(self, irc, filename, speed=speed)
+                irc.reply(result.summary())
+            except Exception as e:
+                logger.exception('Replay of %s failed', filename)
+                irc.error('Replay failed: %s' % e)
+
+        # Even flat out, a night of racing takes a while to replay; keep it off the thread that talks to IRC
+        replayThread = threading.Thread(target=doReplay, name='RacebotReplay')
+        replayThread.setDaemon(True)
+        world.threadsSpawned += 1
+        replayThread.start()
+
+        if world.testing:
+            replayThread.join()
+
+    replay = wrap(replay, ['owner', 'something', optional('float')])
+
+    def drivers(self, irc, msg, args, action, filename):
+        """<export|import> <filename>
+
+        Exports every driver's nick and preferences to a file, or imports them from one (adding or updating drivers,
+        all or nothing.)  Files ending in .json have one JSON object per line; anything else is CSV.
+        """
+
+        if not self.isWarmedUp:
+            irc.reply(self.WARMING_UP_RESPONSE)
+            return
+
+        fileFormat = 'json' if filename.lower().endswith('.json') else 'csv'
+
+        if action == 'export':
+            with open(filename, 'wb') as outputFile:
+                count = self.iRacingData.db.exportDrivers(outputFile, fileFormat)
+
+            irc.reply('Exported %s to %s.' % (utils.str.nItems(count, 'driver'), filename))
+            return
+
+        if not os.path.exists(filename):
+            irc.error('There is no file named %s.' % filename)
+            return
+
+        try:
+            with open(filename, 'rb') as inputFile:
+                count = self.iRacingData.db.importDrivers(inputFile, fileFormat)
+        except ValueError as e:
+            irc.error('Nothing was imported: %s' % e)
+            return
+
+        irc.reply('Imported %s from %s.' % (utils.str.nItems(count, 'driver'), filename))
+
+    drivers = wrap(drivers, ['owner', ('literal', ('export', 'import')), 'something'])
+
 
 Class = Racebot
 
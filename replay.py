@@ -0,0 +1,195 @@
+###
+# Copyright (c) 2015, Jason Neel
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+###
+
+"""
+Replays a capture log (see CaptureLog and the captureFilename config) through IRacingData.grabData and
+Racebot.doBroadcastTick, so that a whole night of racing can be pushed through the bot in seconds to measure tick
+throughput and to see what would have been announced.
+"""
+
+import json
+import time
+
+import supybot.log as logger
+
+from plugin import CaptureLog, IRacingConnection, IRacingData
+
+
+class ReplayConnection(object):
+    """Stands in for IRacingConnection, serving whichever captured responses the replay last fed it"""
+
+    def __init__(self):
+        self.mainPageRawHTML = None
+        self.driverStatusJSON = None
+
+    def login(self):
+        return None
+
+    def fetchMainPageRawHTML(self):
+        return self.mainPageRawHTML
+
+    def fetchDriverStatusJSON(self, friends=True, studied=True, onlineOnly=False):
+        # Each captured status is served once, as it was once per tick when it was captured
+        driverStatusJSON = self.driverStatusJSON
+        self.driverStatusJSON = None
+        return driverStatusJSON
+
+
+class ReplayDB(object):
+    """Stands in for RacebotDB, reading nicks and preferences from the live database but never writing to it, so that
+    replayed drivers are not added to the live drivers table"""
+
+    def __init__(self, db):
+        """
+        @type db: RacebotDB
+        """
+        self.db = db
+
+    @property
+    def preferencesVersion(self):
+        return self.db.preferencesVersion
+
+    def persistDriver(self, driver, nick=None, allowNickReveal=None, allowNameReveal=None, allowRaceAlerts=None,
+                      allowOnlineQuery=None):
+        pass
+
+    def nickForDriver(self, driver):
+        return self.db.nickForDriver(driver)
+
+    def allowNickRevealForDriver(self, driver):
+        return self.db.allowNickRevealForDriver(driver)
+
+    def allowNameRevealForDriver(self, driver):
+        return self.db.allowNameRevealForDriver(driver)
+
+    def allowRaceAlertsForDriver(self, driver):
+        return self.db.allowRaceAlertsForDriver(driver)
+
+    def allowOnlineQueryForDriver(self, driver):
+        return self.db.allowOnlineQueryForDriver(driver)
+
+
+class ReplayState(object):
+    def __init__(self, channels):
+        self.channels = channels
+
+
+class ReplayIrc(object):
+    """Looks enough like an Irc to doBroadcastTick to collect its messages instead of sending them"""
+
+    def __init__(self, network, channels):
+        self.network = network
+        self.state = ReplayState(channels)
+        self.messages = []
+
+    def queueMsg(self, msg):
+        self.messages.append(msg)
+
+
+class ReplayResult(object):
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.tickCount = 0
+        self.mainPageCount = 0
+        self.tickSeconds = 0.0
+        self.elapsedSeconds = 0.0
+        self.capturedSeconds = 0.0
+        self.messages = []
+
+    @property
+    def ticksPerSecond(self):
+        return 0.0 if self.tickSeconds == 0 else self.tickCount / self.tickSeconds
+
+    def summary(self):
+        return ('Replayed %i ticks and %i main pages covering %.0f minutes from %s in %.2f seconds '
+                '(%.1f ticks per second spent ticking.)  %i messages would have been sent.') % \
+               (self.tickCount, self.mainPageCount, self.capturedSeconds / 60, self.filename, self.elapsedSeconds,
+                self.ticksPerSecond, len(self.messages))
+
+
+def replayCapture(racebot, irc, filename, speed=None):
+    """Replays the capture log in filename through racebot's broadcast tick, using a separate IRacingData (reading,
+    but never writing, racebot's database, so nicks and preferences apply) and an irc that only collects what would have been sent to the
+    channels irc is in and to subscribers on irc's network.
+
+    @type racebot: Racebot
+    @param speed: Multiple of real time, i.e. 60 replays an hour in a minute.  None replays as fast as possible.
+    @rtype: ReplayResult
+    """
+    connection = ReplayConnection()
+    racingData = IRacingData(connection, ReplayDB(racebot.iRacingData.db))
+    replayIrc = ReplayIrc(irc.network, irc.state.channels)
+    result = ReplayResult(filename)
+
+    startTime = time.time()
+    firstCaptureTime = None
+    lastCaptureTime = None
+
+    try:
+        for record in CaptureLog(filename).records():
+            captureTime = record['time']
+
+            if firstCaptureTime is None:
+                firstCaptureTime = captureTime
+
+            if speed is not None and lastCaptureTime is not None and captureTime > lastCaptureTime:
+                time.sleep((captureTime - lastCaptureTime) / speed)
+
+            lastCaptureTime = captureTime
+
+            if record['url'].startswith(IRacingConnection.URL_MAIN_PAGE):
+                connection.mainPageRawHTML = record['body']
+
+                # Make the next tick load this main page, as the live bot would have when it was captured
+                racingData.lastSeasonDataFetchTime = None
+                result.mainPageCount += 1
+
+            elif record['url'].startswith(IRacingConnection.URL_GET_DRIVER_STATUS):
+                connection.driverStatusJSON = json.loads(record['body'])
+
+                tickStartTime = time.time()
+                racebot.doBroadcastTick(replayIrc, racingData=racingData)
+                result.tickSeconds += time.time() - tickStartTime
+                result.tickCount += 1
+
+    finally:
+        racingData.closeCatalogWorkerPool()
+
+    result.elapsedSeconds = time.time() - startTime
+    result.capturedSeconds = 0.0 if firstCaptureTime is None else lastCaptureTime - firstCaptureTime
+    result.messages = replayIrc.messages
+
+    for message in result.messages:
+        logger.info('Replay would have sent: %s', message)
+
+    return result
+
+# vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
@@ -0,0 +1,258 @@
+###
+# Copyright (c) 2015, Jason Neel
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+###
+
+"""
+Optional read-only HTTP server for tools that want what the bot knows (who is racing, the catalogs) without polling
+iRacing themselves.  Documents are rebuilt as JSON on the bot's thread whenever the data behind them changes; serving
+them only ever reads those prebuilt bytes, so any number of consumers adds no load on iRacing or the bot.
+
+    GET /drivers                          Online drivers and their sessions
+    GET /catalogs                         Tracks, cars and series
+    GET /changes?since=N&epoch=E[&timeout=S]
+                                          /drivers, once its version is past N, waiting up to S seconds (long poll)
+
+Every document carries a version that only goes up when its content changes, and an ETag for If-None-Match.  Versions
+start again from 1 whenever the bot restarts or the plugin is reloaded, so documents also carry an epoch that changes
+when that happens.  /changes answers at once if the epoch it is given is not the current one.
+"""
+
+import BaseHTTPServer
+import hashlib
+import json
+import os
+import SocketServer
+import threading
+import time
+import urlparse
+
+import supybot.log as logger
+
+from plugin import decodeListingName
+
+DRIVERS_PATH = '/drivers'
+CATALOGS_PATH = '/catalogs'
+CHANGES_PATH = '/changes'
+
+MAX_LONG_POLL_SECONDS = 60
+DEFAULT_LONG_POLL_SECONDS = 30
+
+
+class Document(object):
+
+    def __init__(self, epoch, version, content, body):
+        self.epoch = epoch
+        self.version = version
+        self.content = content      # JSON of the payload alone, to tell whether anything changed
+        self.body = body            # What is served: the payload plus its version
+        self.etag = '"%s"' % hashlib.sha1(body).hexdigest()
+
+
+class StatusPublisher(object):
+    """The documents being served, by path, and a way to wait for one to change"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._documentsByPath = {}
+
+        # Tells this publisher's versions apart from those of the one before a restart or reload
+        self.epoch = os.urandom(8).encode('hex')
+
+    def publish(self, path, payload):
+        content = json.dumps(payload, sort_keys=True)
+
+        with self._condition:
+            current = self._documentsByPath.get(path)
+
+            if current is not None and current.content == content:
+                return
+
+            version = 1 if current is None else current.version + 1
+            body = json.dumps(dict(payload, version=version, epoch=self.epoch), sort_keys=True)
+            self._documentsByPath[path] = Document(self.epoch, version, content, body)
+            self._condition.notifyAll()
+
+    def document(self, path):
+        with self._condition:
+            return self._documentsByPath.get(path)
+
+    def waitForVersionAfter(self, path, epoch, version, timeout):
+        """The document at path once its version is greater than version, or None if that takes longer than timeout.
+        A version from another epoch (or, without one, from the future) means nothing here, so the current document is
+        returned straight away."""
+        deadline = time.time() + timeout
+
+        with self._condition:
+            while True:
+                document = self._documentsByPath.get(path)
+
+                if document is not None and (document.version != version or epoch not in (None, document.epoch)):
+                    return document
+
+                remaining = deadline - time.time()
+
+                if remaining <= 0:
+                    return None
+
+                self._condition.wait(remaining)
+
+
+def driversPayload(racingData):
+    """
+    @type racingData: IRacingData
+    """
+    drivers = []
+
+    for driver in racingData.onlineDrivers():
+        if not driver.allowOnlineQuery:
+            continue
+
+        driverPayload = {'id': driver.id, 'name': driver.nameForPrinting(), 'session': None}
+        session = driver.currentSession
+
+        if session is not None:
+            driverPayload['session'] = {
+                'description': session.sessionDescription,
+                'subSessionId': session.subSessionId,
+                'eventTypeId': session.eventTypeId,
+                'seriesId': session.seasonId,
+                'trackId': session.trackId,
+                'isRace': session.isRaceOrPreRacePractice,
+                'startTime': session.startTime
+            }
+
+        drivers.append(driverPayload)
+
+    drivers.sort(key=lambda driverPayload: driverPayload['id'])
+    # No poll timestamp: it would make every poll look like a change
+    return {'drivers': drivers}
+
+
+def catalogsPayload(racingData):
+    """
+    @type racingData: IRacingData
+    """
+    tracks = [{'id': track['id'], 'name': decodeListingName(track['name']),
+               'config': decodeListingName(track.get('config') or '')} for track in racingData.tracksByID.values()]
+    cars = [{'id': car['id'], 'name': decodeListingName(car['name']), 'abbreviation': car.get('abbrevname')}
+            for car in racingData.carsByID.values()]
+    series = [{'id': season['seriesid'], 'name': decodeListingName(season['seriesshortname']),
+               'fullName': decodeListingName(season.get('seriesname') or '')} for season in racingData.seasonsByID.values()]
+
+    return {
+        'updated': racingData.lastSeasonDataFetchTime,
+        'tracks': sorted(tracks, key=lambda track: track['id']),
+        'cars': sorted(cars, key=lambda car: car['id']),
+        'series': sorted(series, key=lambda aSeries: aSeries['id'])
+    }
+
+
+class StatusRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    server_version = 'Racebot'
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(url.query)
+        publisher = self.server.publisher
+
+        if url.path == CHANGES_PATH:
+            try:
+                since = int(query.get('since', ['0'])[0])
+                timeout = min(float(query.get('timeout', [DEFAULT_LONG_POLL_SECONDS])[0]), MAX_LONG_POLL_SECONDS)
+            except ValueError:
+                self.send_error(400, 'since must be an integer and timeout a number')
+                return
+
+            epoch = query.get('epoch', [None])[0]
+            document = publisher.waitForVersionAfter(DRIVERS_PATH, epoch, since, max(timeout, 0))
+
+            if document is None:
+                # Nothing newer within the timeout; the caller should ask again with the same version
+                self.send_response(204)
+                self.end_headers()
+                return
+
+        elif url.path in (DRIVERS_PATH, CATALOGS_PATH):
+            document = publisher.document(url.path)
+
+            if document is None:
+                self.send_error(503, 'No data yet')
+                return
+
+        else:
+            self.send_error(404)
+            return
+
+        if self.headers.get('If-None-Match') == document.etag:
+            self.send_response(304)
+            self.send_header('ETag', document.etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(document.body)))
+        self.send_header('ETag', document.etag)
+        self.end_headers()
+        self.wfile.write(document.body)
+
+    def log_message(self, format, *args):
+        logger.debug('Status server: %s - %s', self.client_address[0], format % args)
+
+
+class StatusServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Serves a StatusPublisher's documents from its own threads until stop()"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host, port, publisher):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), StatusRequestHandler)
+        self.publisher = publisher
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='RacebotStatusServer')
+        self._thread.setDaemon(True)
+        self._thread.start()
+        logger.info('Racebot status server listening on %s:%i', self.server_address[0], self.port)
+
+    def stop(self):
+        # shutdown() waits for serve_forever() to notice, which never happens if it was not started
+        if self._thread is not None and self._thread.isAlive():
+            self.shutdown()
+
+        self.server_close()
+
+# vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
@@ -31,7 +31,12 @@
 from supybot.test import *
 import logging
 import json
-from plugin import IRacingConnection, Racebot, Driver, RacebotDB
+import os
+import tempfile
+import time
+import supybot.world as world
+from plugin import IRacingConnection, IRacingData, Racebot, Driver, RacebotDB, RenderCache, CaptureLog, RaceCalendar, \
+    CircuitBreaker, DriverStateStore, parseCatalog
 
 logger = logging.getLogger()
 logger.level = logging.DEBUG
@@ -45,11 +50,16 @@ def grabStockIracingHomepage(self):
     return result
 
 def grabEmptyFriendsList(self, friends=True, studied=True, onlineOnly=False):
+    return {'fsRacers': []}
+
+def skipLogin(self):
     return None
 
 # Replace network operations with one that returns stock car/track data and one that returns no friends online
 IRacingConnection.fetchMainPageRawHTML = grabStockIracingHomepage
 IRacingConnection.fetchDriverStatusJSON = grabEmptyFriendsList
+realLogin = IRacingConnection.login
+IRacingConnection.login = skipLogin
 
 def alwaysReturnTrue(self):
     return True
@@ -112,4 +122,440 @@ class RacebotTestCase(PluginTestCase):
         finally:
             IRacingConnection.fetchDriverStatusJSON = oldFriendsListMethod
 
+    def testBroadcastTickPollsOnceForAllNetworks(self):
+        class FakeState(object):
+            def __init__(self, channels):
+                self.channels = dict((channel, None) for channel in channels)
+
+        class FakeIrc(object):
+            zombie = False
+
+            def __init__(self, network, channels):
+                self.network = network
+                self.state = FakeState(channels)
+                self.sent = []
+
+            def queueMsg(self, msg):
+                self.sent.append(msg)
+
+        fetchCount = [0]
+
+        def friendsListRaceInProgress(self, friends=True, studied=True, onlineOnly=False):
+            fetchCount[0] += 1
+            with open('Racebot/data/GetDriverStatus-publicRace.txt', 'r') as friendsList:
+                return json.loads(friendsList.read())
+
+        ircs = [FakeIrc('one', ['#one', '#same']), FakeIrc('two', ['#two', '#three', '#same'])]
+
+        # Channel settings are per network; #same only wants race alerts on network one
+        raceAlerts = conf.supybot.plugins.Racebot.raceRegistrationAlerts
+        raceAlerts.get(':two').get('#same').setValue(False)
+
+        try:
+            oldFriendsListMethod = IRacingConnection.fetchDriverStatusJSON
+            IRacingConnection.fetchDriverStatusJSON = friendsListRaceInProgress
+            oldIrcs = world.ircs[:]
+            world.ircs[:] = ircs
+
+            self.irc.getCallback('Racebot').doBroadcastTick()
+            self.assertEqual(fetchCount[0], 1)
+
+            # The registration is still there on the next tick, but has already been announced
+            self.irc.getCallback('Racebot').doBroadcastTick()
+
+        finally:
+            IRacingConnection.fetchDriverStatusJSON = oldFriendsListMethod
+            world.ircs[:] = oldIrcs
+            raceAlerts.get(':two').get('#same').setValue(True)
+
+        self.assertEqual(fetchCount[0], 2)
+        self.assertEqual(sorted(msg.args[0] for msg in ircs[0].sent), ['#one', '#same'])
+        self.assertEqual(sorted(msg.args[0] for msg in ircs[1].sent), ['#three', '#two'])
+
+    def testSubscriptions(self):
+        class FakeState(object):
+            channels = {}
+
+        class FakeIrc(object):
+            zombie = False
+            state = FakeState()
+
+            def __init__(self, network):
+                self.network = network
+                self.sent = []
+
+            def queueMsg(self, msg):
+                self.sent.append(msg)
+
+        def friendsListRaceInProgress(self, friends=True, studied=True, onlineOnly=False):
+            with open('Racebot/data/GetDriverStatus-publicRace.txt', 'r') as friendsList:
+                return json.loads(friendsList.read())
+
+        self.assertRegexp('subscribe series NASCAR iRacing Tour Modified', 'NASCAR iRacing Tour Modified Series')
+        self.assertRegexp('subscriptions', 'series NASCAR iRacing Tour Modified Series')
+        self.assertError('subscribe track zzzz')
+
+        fakeIrc = FakeIrc(self.irc.network)
+
+        try:
+            oldFriendsListMethod = IRacingConnection.fetchDriverStatusJSON
+            IRacingConnection.fetchDriverStatusJSON = friendsListRaceInProgress
+
+            # Subscribers hear about a registration once, not every tick
+            racebot = self.irc.getCallback('Racebot')
+            racebot.doBroadcastTick(fakeIrc)
+            racebot.doBroadcastTick(fakeIrc)
+
+        finally:
+            IRacingConnection.fetchDriverStatusJSON = oldFriendsListMethod
+
+        self.assertEqual([msg.args[0] for msg in fakeIrc.sent], [self.nick])
+
+        self.assertNotError('unsubscribe series NASCAR iRacing Tour Modified')
+        self.assertError('unsubscribe series NASCAR iRacing Tour Modified')
+
+    def testLinkAndWhois(self):
+        def friendsListRaceInProgress(self, friends=True, studied=True, onlineOnly=False):
+            result = None
+            with open('Racebot/data/GetDriverStatus-publicRace.txt', 'r') as friendsList:
+                result = friendsList.read()
+            return json.loads(result)
+
+        try:
+            oldFriendsListMethod = IRacingConnection.fetchDriverStatusJSON
+            IRacingConnection.fetchDriverStatusJSON = friendsListRaceInProgress
+
+            # Populate the database with the drivers in this data
+            self.assertNotError('racers')
+
+            self.assertError('link %s Nobody Atall' % self.nick)
+            self.assertNotError('link %s Casey Atbat' % self.nick)
+            self.assertError('link someoneElse Casey Atbat')
+            self.assertRegexp('whois %s' % self.nick, 'is an iRacing driver')
+            self.assertRegexp('whois someoneElse', 'do not know')
+
+            # Only admins may link, since a nick is what lets the bot announce a driver
+            self.assertError('link someoneElse Test Target', frm='someoneElse!user@__no_testcap__')
+
+            self.assertNotError('unlink')
+            self.assertRegexp('whois %s' % self.nick, 'do not know')
+            self.assertError('unlink')
+
+        finally:
+            IRacingConnection.fetchDriverStatusJSON = oldFriendsListMethod
+
+    def testNonASCIINames(self):
+        def friendsListWithAccents(self, friends=True, studied=True, onlineOnly=False):
+            with open('Racebot/data/GetDriverStatus-publicRace.txt', 'r') as friendsList:
+                result = json.loads(friendsList.read())
+
+            for racer in result['fsRacers']:
+                if racer['name'] == 'Casey+Atbat':
+                    racer['name'] = u'J%C3%B6rg+M%C3%BCller'
+                    racer['custid'] = -4242
+
+            return result
+
+        try:
+            oldFriendsListMethod = IRacingConnection.fetchDriverStatusJSON
+            IRacingConnection.fetchDriverStatusJSON = friendsListWithAccents
+
+            self.assertNotError('racers')
+
+            self.assertRegexp(u'subscribe driver J\u00f6rg M\u00fcller', 'You will hear about')
+            self.assertNotError(u'link %s J\u00f6rg M\u00fcller' % self.nick)
+            self.assertError(u'subscribe driver J\u00f6rg')
+            self.assertNotError('unlink')
+
+        finally:
+            IRacingConnection.fetchDriverStatusJSON = oldFriendsListMethod
+
+    def testReplayCapture(self):
+        captureFilename = os.path.join(tempfile.mkdtemp(), 'capture.ndjson.gz')
+        captureLog = CaptureLog(captureFilename)
+
+        with open('Racebot/data/iRacingMainPage.txt', 'r') as mainPage:
+            captureLog.append(IRacingConnection.URL_MAIN_PAGE, mainPage.read().decode('latin-1'), timestamp=1000.0)
+
+        for dataFilename in ('GetDriverStatus-publicRace-notYetStarted.txt', 'GetDriverStatus-publicRace.txt'):
+            with open('Racebot/data/' + dataFilename, 'r') as friendsList:
+                captureLog.append(IRacingConnection.URL_GET_DRIVER_STATUS, friendsList.read(), timestamp=1300.0)
+
+        self.assertRegexp('replay %s' % captureFilename, 'Replayed 2 ticks and 1 main pages')
+        # Replayed drivers are not added to the live database
+        self.assertIsNone(self.irc.getCallback('Racebot').iRacingData.db.rowForDriverID(-60))
+        self.assertError('replay %s' % (captureFilename + '.missing'))
+
+    def testUpcoming(self):
+        # The stock main page is from a season long past
+        self.assertResponse('upcoming', 'Nothing more is scheduled this season.')
+        self.assertError('upcoming No Such Series')
+        self.assertRegexp(u'upcoming N\u00fcr', 'do not know')
+
+        # Every series changes week at once, so the list is capped
+        calendar = self.irc.getCallback('Racebot').iRacingData.calendar
+        weekChange = max(calendar.startTimes, key=calendar.startTimes.count)
+        pluginModule = sys.modules[Racebot.__module__]
+
+        class FakeClock(object):
+            @staticmethod
+            def time():
+                return weekChange - 60
+
+        try:
+            pluginModule.time = FakeClock
+            self.assertRegexp('upcoming', 'Starting within the hour: ')
+            self.assertNotError('more')
+            self.assertRegexp('more', ', and %i more$' % (40 - Racebot.MAX_SEARCH_RESULTS))
+
+        finally:
+            pluginModule.time = time
+
+    def testCatalogSearch(self):
+        self.assertRegexp('track spa', 'Circuit de Spa-Francorchamps')
+        self.assertRegexp('track lagna seca', 'Laguna Seca')
+        self.assertRegexp(u'track N\u00fcr', 'rburgring')
+        self.assertRegexp('car mx5', 'Mazda MX-5 Cup')
+        self.assertRegexp('series skip barber', 'Skip Barber Race Series')
+        self.assertRegexp('series zzzz', 'do not know')
+
+    def testRaceCalendar(self):
+        weekSeconds = RaceCalendar.SECONDS_PER_RACE_WEEK
+        seasons = [
+            {'seriesid': 1, 'seriesshortname': 'Skip+Barber', 'start': 0, 'end': 3 * weekSeconds * 1000,
+             'tracks': [{'id': 10, 'name': 'Lime+Rock', 'raceweek': 0}, {'id': 11, 'name': 'Spa', 'raceweek': 1},
+                        {'id': 12, 'name': 'Monza', 'raceweek': 2}]},
+            {'seriesid': 2, 'seriesshortname': 'Skippy+Cup', 'start': 0, 'end': 2 * weekSeconds * 1000,
+             'tracks': [{'id': 11, 'name': 'Spa', 'raceweek': 1}, {'id': 13, 'name': 'Off+Week', 'raceweek': 2}]}
+        ]
+        calendar = RaceCalendar(seasons)
+
+        self.assertEqual(len(calendar), 4)
+        self.assertEqual(calendar.nextStartTime(0), weekSeconds)
+        self.assertEqual(calendar.nextStartTime(3 * weekSeconds), None)
+        self.assertEqual(len(calendar.raceWeeksStartingBetween(0, weekSeconds)), 2)
+        self.assertEqual(calendar.nextRaceWeekForSeries(1, weekSeconds).trackName, 'Monza')
+        self.assertEqual(calendar.nextRaceWeekForTrack(11, 0).raceWeek, 2)
+        self.assertEqual(sorted(calendar.seriesIDsWithNamePrefix('skip')), [1, 2])
+        self.assertEqual(calendar.seriesIDsWithNamePrefix('Skip B'), [1])
+
+    def testRacersIRacingUnreachable(self):
+        def unreachable(self, friends=True, studied=True, onlineOnly=False):
+            return None
+
+        try:
+            oldFriendsListMethod = IRacingConnection.fetchDriverStatusJSON
+            IRacingConnection.fetchDriverStatusJSON = unreachable
+
+            # Whether we have stale data to show depends on what earlier tests fetched; either way, we must say so
+            self.assertRegexp('racers', '(%s|as of .* ago)' % re.escape(Racebot.UNREACHABLE_RESPONSE))
+
+        finally:
+            IRacingConnection.fetchDriverStatusJSON = oldFriendsListMethod
+
+    def testCircuitBreaker(self):
+        breaker = CircuitBreaker('test')
+
+        for _ in range(CircuitBreaker.FAILURE_THRESHOLD - 1):
+            breaker.recordFailure()
+        self.failUnless(breaker.allowRequest())
+
+        breaker.recordFailure()
+        self.failIf(breaker.allowRequest())
+        self.failUnless(breaker.openUntil - time.time() <= CircuitBreaker.BASE_DELAY_SECONDS)
+
+        breaker.recordSuccess()
+        self.failUnless(breaker.allowRequest())
+        self.assertEqual(breaker.openCount, 0)
+
+    def testFailedLoginCountsOnce(self):
+        class FailingSession(object):
+            def post(self, *args, **kwargs):
+                raise IOError('unreachable')
+
+        connection = IRacingConnection('user', 'password')
+        connection._session = FailingSession()
+        connection._get = lambda url: (None, True)
+        connection.login = realLogin.__get__(connection)
+
+        self.assertIsNone(connection.requestURL(IRacingConnection.URL_MAIN_PAGE))
+        self.assertEqual(connection.circuitBreaker.consecutiveFailures, 1)
+
+    def testMemory(self):
+        self.assertRegexp('memory', 'drivers: \\d+, ~')
+        # Measuring the lazily built calendar and search indexes does not build them
+        self.assertEqual(self.irc.getCallback('Racebot').iRacingData.catalog.builtStructures(), (None, ()))
+        self.assertRegexp('memory start', 'Watching memory')
+        self.assertNotError('racers')
+        self.assertNotError('memory stop')
+
+    def testStatusServer(self):
+        import urllib2
+        import statusserver
+
+        def friendsListRaceInProgress(self, friends=True, studied=True, onlineOnly=False):
+            with open('Racebot/data/GetDriverStatus-publicRace.txt', 'r') as friendsList:
+                return json.loads(friendsList.read())
+
+        # Stopping a server that never started must not wait for it
+        statusserver.StatusServer('127.0.0.1', 0, statusserver.StatusPublisher()).stop()
+
+        racebot = self.irc.getCallback('Racebot')
+        server = statusserver.StatusServer('127.0.0.1', 0, statusserver.StatusPublisher())
+        url = 'http://127.0.0.1:%i' % server.port
+
+        try:
+            oldFriendsListMethod = IRacingConnection.fetchDriverStatusJSON
+            IRacingConnection.fetchDriverStatusJSON = friendsListRaceInProgress
+            racebot.statusServer = server
+            server.start()
+            self.assertNotError('racers')
+
+            response = urllib2.urlopen(url + statusserver.DRIVERS_PATH)
+            drivers = json.loads(response.read())
+            self.assertEqual(drivers['version'], 1)
+            self.assertTrue(drivers['drivers'])
+            self.assertTrue(json.loads(urllib2.urlopen(url + statusserver.CATALOGS_PATH).read())['tracks'])
+
+            # Unchanged data keeps its version, so conditional requests and long polls see nothing new
+            self.assertNotError('racers')
+            request = urllib2.Request(url + statusserver.DRIVERS_PATH,
+                                      headers={'If-None-Match': response.info().getheader('ETag')})
+            try:
+                urllib2.urlopen(request)
+                self.fail('Expected 304 Not Modified')
+            except urllib2.HTTPError as e:
+                self.assertEqual(e.code, 304)
+
+            changesURL = url + statusserver.CHANGES_PATH + '?since=%i&epoch=%s&timeout=0'
+            self.assertEqual(urllib2.urlopen(changesURL % (1, drivers['epoch'])).getcode(), 204)
+
+            # Versions from before a restart (another epoch, or one we have not reached) are answered at once
+            for since, epoch in ((0, drivers['epoch']), (57, drivers['epoch']), (1, 'before-a-restart')):
+                self.assertEqual(json.loads(urllib2.urlopen(changesURL % (since, epoch)).read()), drivers)
+
+        finally:
+            IRacingConnection.fetchDriverStatusJSON = oldFriendsListMethod
+            racebot.statusServer = None
+            server.stop()
+
+    def testCatalogRefreshInBackground(self):
+        self.assertIsNone(parseCatalog('<html></html>'))
+
+        # The main page comes from the stock data (see grabStockIracingHomepage)
+        racingData = IRacingData(IRacingConnection('user', 'password'), None)
+
+        try:
+            racingData.grabSeasonData(wait=False)
+            self.assertIsNone(racingData.lastSeasonDataFetchTime)
+
+            # The worker's catalog is installed on a later tick
+            while racingData.collectPendingCatalog():
+                time.sleep(0.05)
+
+        finally:
+            racingData.closeCatalogWorkerPool()
+
+        self.assertEqual(racingData.catalogVersion, 1)
+        self.assertIsNotNone(racingData.lastSeasonDataFetchTime)
+        self.assertTrue(racingData.seasonsByID)
+        self.assertTrue(racingData.catalog.raceWeekStartTimes)
+        self.assertEqual(len(racingData.trackIndex), len(racingData.tracksByID))
+        self.assertEqual(len(racingData.calendar), len(racingData.catalog.calendar))
+
+    def testCatalogRefreshInBackgroundFails(self):
+        class ChangedListingConnection(object):
+            def fetchMainPageRawHTML(self):
+                # Listings that are there, but no longer look like they used to
+                return ''.join("var %s = extractJSON('%s');\n" % (listing, '[{}]' if listing == 'TrackListing' else '[]')
+                               for listing in ('TrackListing', 'CarListing', 'CarClassListing', 'SeasonListing'))
+
+        racingData = IRacingData(ChangedListingConnection(), None)
+
+        try:
+            racingData.grabSeasonData(wait=False)
+
+            while racingData.collectPendingCatalog():
+                time.sleep(0.05)
+
+        finally:
+            racingData.closeCatalogWorkerPool()
+
+        # Nothing was installed, so the next tick tries again rather than waiting out the 12 hours
+        self.assertEqual(racingData.catalogVersion, 0)
+        self.assertIsNone(racingData.lastSeasonDataFetchTime)
+
+    def testDriverExportAndImport(self):
+        import StringIO
+
+        db = RacebotDB(os.path.join(tempfile.mkdtemp(), 'drivers.sqlite3'))
+        imported = db.importDrivers(StringIO.StringIO('id,real_name,nick,allow_race_alerts\n1,Test+Target,tt,0\n2,,,1\n'))
+        self.assertEqual(imported, 2)
+        self.assertEqual(db.rowForDriverID(1)['allow_race_alerts'], 0)
+        self.assertEqual(db.rowForDriverID(2)['allow_race_alerts'], 1)
+        self.assertEqual(db.rowForDriverID(2)['allow_online_query'], 1)
+
+        # Left out columns keep their values, and a bad row imports nothing
+        db.importDrivers(StringIO.StringIO('{"id": 1, "allow_online_query": 0}\n'), 'json')
+        self.assertEqual(db.rowForDriverID(1)['nick'], 'tt')
+        self.assertEqual(db.rowForDriverID(1)['allow_online_query'], 0)
+        self.assertRaises(ValueError, db.importDrivers, StringIO.StringIO('id,nick\n3,three\nthree,three\n'))
+        self.assertIsNone(db.rowForDriverID(3))
+
+        exported = StringIO.StringIO()
+        self.assertEqual(db.exportDrivers(exported, 'json'), 2)
+        copy = RacebotDB(os.path.join(tempfile.mkdtemp(), 'drivers.sqlite3'))
+        copy.importDrivers(StringIO.StringIO(exported.getvalue()), 'json')
+        self.assertEqual(tuple(copy.rowForDriverID(1)), tuple(db.rowForDriverID(1)))
+
+        # Restoring a backup clears a nick set since it was taken
+        for fileFormat in ('csv', 'json'):
+            backup = StringIO.StringIO()
+            db.exportDrivers(backup, fileFormat)
+            db.linkNickToDriverID('since', 2)
+            db.importDrivers(StringIO.StringIO(backup.getvalue()), fileFormat)
+            self.assertIsNone(db.rowForDriverID(2)['nick'])
+            self.assertEqual(db.rowForDriverID(1)['nick'], 'tt')
+
+        filename = os.path.join(tempfile.mkdtemp(), 'drivers.csv')
+        self.assertRegexp('drivers export %s' % filename, 'Exported \\d+ drivers? to')
+        self.assertRegexp('drivers import %s' % filename, 'Imported \\d+ drivers? from')
+
+    def testDriverStateStore(self):
+        with open('Racebot/data/GetDriverStatus-publicRace.txt', 'r') as friendsList:
+            racers = json.loads(friendsList.read())['fsRacers']
+
+        def loadedIDs(racersJSON):
+            return sorted(racer['custid'] for racer in store.load(racersJSON))
+
+        store = DriverStateStore()
+        self.assertEqual(loadedIDs(racers), sorted(racer['custid'] for racer in racers))
+
+        # After that, only the driver in a session (1) needs updating
+        self.assertEqual(loadedIDs(racers), [1])
+
+        # Left out of a poll, 1 keeps the session, and is updated once when seen without it
+        idleRacers = [racer for racer in racers if racer['custid'] != 1]
+        leftSession = {'custid': 1, 'name': 'Test+Target', 'lastSeen': 1}
+        self.assertEqual(loadedIDs(idleRacers), [])
+        self.assertEqual(loadedIDs(idleRacers + [leftSession]), [1])
+        self.assertEqual(loadedIDs(idleRacers + [leftSession]), [])
+
+        self.assertEqual(loadedIDs(idleRacers + [{'custid': 1234, 'name': 'New+Guy', 'lastSeen': 1}]), [1234])
+        self.assertEqual(len(store), len(racers) + 1)
+
+    def testRenderCacheInvalidatesOnVersionChange(self):
+        cache = RenderCache()
+        renderCount = [0]
+
+        def render():
+            renderCount[0] += 1
+            return 'rendered %d' % renderCount[0]
+
+        self.assertEqual(cache.get(1, 0, render), 'rendered 1')
+        self.assertEqual(cache.get(1, 0, render), 'rendered 1')
+        self.assertEqual(cache.get(1, 1, render), 'rendered 2')
+        self.assertEqual(renderCount[0], 2)
+        self.assertEqual(len(cache), 1)
+
 # vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79: